@@ -5,6 +5,7 @@ AWS CDK Stack for Terrastride Events Service
 import os
 from aws_cdk import (
     App,
+    DockerVolume,
     Stack,
     CfnOutput,
     Duration,
@@ -18,10 +19,20 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+# Host pip cache mounted into the bundling containers, wheels are reused across synths
+PIP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pip")
+
+# Shared build scripts (build_validators.py), mounted into the bundling containers
+BUILD_SCRIPTS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "scripts")
+)
+
 
 def lambda_bundling(directory: str):
     """Helper function for Lambda bundling configuration."""
 
+    os.makedirs(PIP_CACHE_DIR, exist_ok=True)
+
     return {
         "image": _lambda.Runtime.PYTHON_3_12.bundling_image,  # pylint: disable=no-member
         "command": [
@@ -29,11 +40,24 @@ def lambda_bundling(directory: str):
             "-c",
             (
                 f"cd {directory} && "
-                "pip install aws-lambda-powertools fastjsonschema -t /asset-output && "
-                "cp -r . /asset-output && "
-                "cp ../middleware.py /asset-output"
+                "pip install aws-lambda-powertools fastjsonschema cachetools orjson "
+                "--cache-dir /pip-cache -t /asset-output && "
+                # Copy the handler without tests, docs or local caches
+                "tar -c --exclude=tests --exclude='test_*' --exclude='*.md' "
+                "--exclude=.venv --exclude=__pycache__ --exclude='*.pyc' . "
+                "| tar -x -C /asset-output && "
+                "cp ../middleware.py ../aws_clients.py /asset-output && "
+                # Turn the request schemas into Python code once, at build time
+                "if [ -f validation_schema.py ]; then "
+                "PYTHONPATH=/asset-output "
+                "python /build-scripts/build_validators.py /asset-output; "
+                "fi"
             ),
         ],
+        "volumes": [
+            DockerVolume(host_path=PIP_CACHE_DIR, container_path="/pip-cache"),
+            DockerVolume(host_path=BUILD_SCRIPTS_DIR, container_path="/build-scripts"),
+        ],
     }
 
 
@@ -53,6 +77,9 @@ class TerrastrideEventsStack(Stack):
         # Events:
         # PK: id
         # GSI: city-index -> partition city, sort startdate for searching events by city
+        # GSI: active_events-index -> sparse, partition event_status, sort created_at
+        # DynamoDB takes one GSI creation per table update, city_prefix-index and
+        # name_prefix-index (search by prefix) each land in a later deploy
         events_table = dynamodb.Table(
             self,
             "EventsTable",
@@ -74,6 +101,17 @@ class TerrastrideEventsStack(Stack):
             projection_type=dynamodb.ProjectionType.ALL,
         )
 
+        events_table.add_global_secondary_index(
+            index_name="active_events-index",
+            partition_key=dynamodb.Attribute(
+                name="event_status", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="created_at", type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
         # Event Tickets:
         # PK: id
         # GSI: event_id-index -> partition event_id for searching tickets by event
@@ -223,6 +261,10 @@ class TerrastrideEventsStack(Stack):
                 "USER_POOL_ID": user_pool_id,
                 "EVENTS_TABLE": events_table.table_name,
                 "EVENT_TICKETS_TABLE": event_tickets_table.table_name,
+                # Set to "true" once scripts/backfill_event_status.py has run
+                "ACTIVE_EVENTS_INDEX_READY": "false",
+                # Set to "true" once both prefix indexes exist and are backfilled
+                "SEARCH_PREFIX_INDEXES_READY": "false",
             },
             timeout=Duration.seconds(30),
         )
@@ -343,20 +385,34 @@ class TerrastrideEventsStack(Stack):
             ),
         )
 
-        # API Gateway Integrations
-        healthcheck_integration = apigw.LambdaIntegration(healthcheck_lambda)
-        buy_event_ticket_integration = apigw.LambdaIntegration(buy_event_ticket_lambda)
+        # API Gateway Integrations, no extra permissions for console test invokes
+        healthcheck_integration = apigw.LambdaIntegration(
+            healthcheck_lambda, allow_test_invoke=False
+        )
+        buy_event_ticket_integration = apigw.LambdaIntegration(
+            buy_event_ticket_lambda, allow_test_invoke=False
+        )
         verify_event_ticket_integration = apigw.LambdaIntegration(
-            verify_event_ticket_lambda
+            verify_event_ticket_lambda, allow_test_invoke=False
+        )
+        create_event_integration = apigw.LambdaIntegration(
+            create_event_lambda, allow_test_invoke=False
+        )
+        delete_event_integration = apigw.LambdaIntegration(
+            delete_event_lambda, allow_test_invoke=False
+        )
+        edit_event_integration = apigw.LambdaIntegration(
+            edit_event_lambda, allow_test_invoke=False
+        )
+        list_events_integration = apigw.LambdaIntegration(
+            list_events_lambda, allow_test_invoke=False
         )
-        create_event_integration = apigw.LambdaIntegration(create_event_lambda)
-        delete_event_integration = apigw.LambdaIntegration(delete_event_lambda)
-        edit_event_integration = apigw.LambdaIntegration(edit_event_lambda)
-        list_events_integration = apigw.LambdaIntegration(list_events_lambda)
         finish_event_race_integration = apigw.LambdaIntegration(
-            finish_event_race_lambda
+            finish_event_race_lambda, allow_test_invoke=False
+        )
+        get_user_tickets_integration = apigw.LambdaIntegration(
+            get_user_tickets_lambda, allow_test_invoke=False
         )
-        get_user_tickets_integration = apigw.LambdaIntegration(get_user_tickets_lambda)
 
         # API Gateway Resources and Methods
 
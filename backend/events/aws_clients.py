@@ -0,0 +1,30 @@
+"""
+Shared AWS clients for the events Lambda functions.
+Created once per execution environment and reused across invocations.
+"""
+
+import os
+import boto3
+from botocore.config import Config
+
+# Environment variables
+AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
+
+# Single session so service models are loaded only once
+SESSION = boto3.session.Session(region_name=AWS_REGION)
+
+# Keep pooled HTTPS connections alive between warm invocations
+CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    retries={"max_attempts": 3, "mode": "standard"},
+)
+
+# DynamoDB resource
+dynamodb = SESSION.resource("dynamodb", config=CLIENT_CONFIG)
+
+# Low-level DynamoDB client for transactions, which take attribute values directly
+dynamodb_client = SESSION.client("dynamodb", config=CLIENT_CONFIG)
+
+# Cognito client
+cognito_client = SESSION.client("cognito-idp", config=CLIENT_CONFIG)
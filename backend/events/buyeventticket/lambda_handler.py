@@ -4,35 +4,39 @@ and the user has sufficient balance.
 """
 
 import os
-import json
+import orjson
 import uuid
 from decimal import Decimal
 from datetime import datetime
-from datetime import timezone
-import boto3
+from boto3.dynamodb.conditions import Key
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb, cognito_client
+from middleware import (
+    middleware,
+    http_response,
+    get_user_id,
+    is_event_active,
+    CORS_PREFLIGHT_RESPONSE,
+    load_validator,
+)
 from validation_schema import schema
 
 # Logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 EVENT_TICKETS_TABLE = os.environ.get("EVENT_TICKETS_TABLE")
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 
 # DynamoDB clients
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 tickets_table = dynamodb.Table(EVENT_TICKETS_TABLE)
 
-# Cognito client
-cognito_client = boto3.client("cognito-idp", region_name=AWS_REGION)
+# Validator generated at bundling time
+validator = load_validator(schema)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -44,15 +48,15 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # CORS preflight
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     headers = event.get("headers") or {}
-    body = json.loads(event.get("body") or "{}")
+    raw_body = event.get("body")
+    body = orjson.loads(raw_body) if raw_body else {}
 
     # Validate request
-    validate(event=body, schema=schema)
+    validator(body)
 
     user_id = get_user_id(headers)
     if not user_id:
@@ -62,32 +66,19 @@ def lambda_handler(event, context):
 
     event_id = body["event_id"]
 
-    # Get event details (active)
-    event_item = events_table.get_item(Key={"id": event_id}).get("Item")
+    # Get event details (active), only the fields checked below
+    event_item = events_table.get_item(
+        Key={"id": event_id},
+        ProjectionExpression=(
+            "startdate, enddate, startdate_epoch, enddate_epoch, entry_fee"
+        ),
+    ).get("Item")
     if not event_item:
         return http_response(
             400, {"status": "error", "message": "Event does not exist"}
         )
 
-    # Parse event datetimes as aware UTC
-    startdate = datetime.fromisoformat(event_item["startdate"])
-    enddate = datetime.fromisoformat(event_item["enddate"])
-
-    # Ensure they are aware in UTC
-    if startdate.tzinfo is None:
-        startdate = startdate.replace(tzinfo=timezone.utc)
-    else:
-        startdate = startdate.astimezone(timezone.utc)
-
-    if enddate.tzinfo is None:
-        enddate = enddate.replace(tzinfo=timezone.utc)
-    else:
-        enddate = enddate.astimezone(timezone.utc)
-
-    # Current UTC time
-    now = datetime.now(timezone.utc)
-
-    if not startdate <= now <= enddate:
+    if not is_event_active(event_item):
         return http_response(400, {"status": "error", "message": "Event is not active"})
 
     entry_fee = Decimal(str(event_item.get("entry_fee", 0)))
@@ -95,7 +86,7 @@ def lambda_handler(event, context):
     # Check if user already has a ticket
     existing_tickets = tickets_table.query(
         IndexName="user_id-index",
-        KeyConditionExpression=boto3.dynamodb.conditions.Key("user_id").eq(user_id),
+        KeyConditionExpression=Key("user_id").eq(user_id),
     )["Items"]
 
     if any(t["event_id"] == event_id for t in existing_tickets):
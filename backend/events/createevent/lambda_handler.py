@@ -3,28 +3,37 @@ Lambda function to create a new running event in DynamoDB.
 """
 
 import os
-import json
+import orjson
 import uuid
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
-import boto3
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+    CORS_PREFLIGHT_RESPONSE,
+    get_user_id,
+    search_prefixes,
+    ACTIVE_EVENT_STATUS,
+    normalize_list,
+    load_validator,
+)
 from validation_schema import schema
 
 logger = Logger()
 
 # Environment
-AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 
+# Validator generated at bundling time
+validator = load_validator(schema)
+
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -35,17 +44,17 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle preflight OPTIONS
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     # Parse body
-    event_body = json.loads(event.get("body") or "{}")
+    raw_body = event.get("body")
+    event_body = orjson.loads(raw_body) if raw_body else {}
     headers = event.get("headers") or {}
 
     # Validate schema
     logger.info("Validating event creation request")
-    validate(event=event_body, schema=schema)
+    validator(event_body)
 
     user_id = get_user_id(headers)
     if not user_id:
@@ -55,7 +64,9 @@ def lambda_handler(event, context):
 
     # Extract main event info
     name = event_body["name"]
+    name_lower = name.lower()
     city = event_body["city"]
+    city_lower = city.lower()
     km_long = Decimal(str(event_body["km_long"]))
     entry_fee = Decimal(str(event_body["entry_fee"]))
     date_str = event_body["date"]  # YYYY-MM-DD
@@ -77,15 +88,19 @@ def lambda_handler(event, context):
     item = {
         "id": event_id,
         "name": name,
-        "name_lower": name.lower(),
+        "name_lower": name_lower,
         "city": city,
-        "city_lower": city.lower(),
+        "city_lower": city_lower,
+        **search_prefixes(name_lower, city_lower),
         "km_long": km_long,
         "is_distributed": 0,
         "startdate": start_datetime.isoformat(),
         "enddate": end_datetime.isoformat(),
+        "startdate_epoch": int(start_datetime.timestamp()),
+        "enddate_epoch": int(end_datetime.timestamp()),
         "entry_fee": entry_fee,
         "created_at": created_at,
+        "event_status": ACTIVE_EVENT_STATUS,
         "user_id": user_id,
         "runs": [],
         "checkpoints": normalize_list(checkpoints),
@@ -104,18 +119,3 @@ def lambda_handler(event, context):
             "event_id": event_id,
         },
     )
-
-
-def normalize_list(data_list):
-    """Convert float values in a list of dicts to Decimal."""
-
-    normalized = []
-    for item in data_list:
-        normalized_item = {}
-        for k, v in item.items():
-            if isinstance(v, float):
-                normalized_item[k] = Decimal(str(v))
-            else:
-                normalized_item[k] = v
-        normalized.append(normalized_item)
-    return normalized
@@ -4,25 +4,32 @@ Lambda function to soft delete an event and its nested checkpoints/traces in Dyn
 
 import os
 from datetime import datetime, timezone
-import boto3
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+    CORS_PREFLIGHT_RESPONSE,
+    load_validator,
+)
 from validation_schema import path_params_schema
 
 # Logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 
+# Validator generated at bundling time
+path_params_validator = load_validator(
+    path_params_schema, "compiled_path_params_validator"
+)
+
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -33,13 +40,12 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # CORS preflight
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     # Validate path parameters
     path_params = event.get("pathParameters") or {}
-    validate(event=path_params, schema=path_params_schema)
+    path_params_validator(path_params)
 
     event_id = path_params.get("event_id")
     if not event_id:
@@ -52,7 +58,9 @@ def lambda_handler(event, context):
     # Soft delete the event
     response = events_table.update_item(
         Key={"id": event_id},
-        UpdateExpression="SET deleted_at = :deleted_at, updated_at = :deleted_at",
+        UpdateExpression=(
+            "SET deleted_at = :deleted_at, updated_at = :deleted_at REMOVE event_status"
+        ),
         ExpressionAttributeValues={":deleted_at": timestamp},
         ConditionExpression="attribute_not_exists(deleted_at)",
         ReturnValues="ALL_NEW",
@@ -6,23 +6,20 @@ import os
 from datetime import datetime, timezone
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key
-import boto3
 from aws_lambda_powertools import Logger
 
 # pylint: disable=import-error
+from aws_clients import dynamodb, cognito_client
 from middleware import middleware, http_response
 
 logger = Logger()
 
 # Environment
-AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
-cognito_client = boto3.client("cognito-idp", region_name=AWS_REGION)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -81,21 +78,6 @@ def lambda_handler(_, context):
     )
 
 
-def normalize_list(data_list):
-    """Convert float values in a list of dicts to Decimal."""
-
-    normalized = []
-    for item in data_list:
-        normalized_item = {}
-        for k, v in item.items():
-            if isinstance(v, float):
-                normalized_item[k] = Decimal(str(v))
-            else:
-                normalized_item[k] = v
-        normalized.append(normalized_item)
-    return normalized
-
-
 def get_finished_events():
     """Fetch events that have finished but not yet distributed awards."""
 
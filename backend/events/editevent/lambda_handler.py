@@ -3,28 +3,40 @@ Lambda function to edit an existing running event in DynamoDB.
 """
 
 import os
-import json
+import orjson
 from decimal import Decimal
 from datetime import datetime, timedelta, timezone
-import boto3
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
+from botocore.exceptions import ClientError
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+    CORS_PREFLIGHT_RESPONSE,
+    get_user_id,
+    search_prefixes,
+    normalize_list,
+    load_validator,
+)
 from validation_schema import schema, path_params_schema
 
 # Logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 
+# Validators generated at bundling time
+path_params_validator = load_validator(
+    path_params_schema, "compiled_path_params_validator"
+)
+validator = load_validator(schema)
+
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -35,17 +47,17 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle CORS preflight
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     headers = event.get("headers") or {}
     path_params = event.get("pathParameters") or {}
-    body = json.loads(event.get("body") or "{}")
+    raw_body = event.get("body")
+    body = orjson.loads(raw_body) if raw_body else {}
 
     # Validate schemas
-    validate(event=path_params, schema=path_params_schema)
-    validate(event=body, schema=schema)
+    path_params_validator(path_params)
+    validator(body)
 
     event_id = path_params.get("event_id")
     user_id = get_user_id(headers)
@@ -67,48 +79,70 @@ def lambda_handler(event, context):
     checkpoints = normalize_list(body["checkpoints"])
     trace_points = normalize_list(body["trace"])
 
-    # Combine date + startTime
-    start_datetime = datetime.strptime(f"{date_str} {start_time}", "%Y-%m-%d %H:%M")
+    # Combine date + startTime (formats are enforced by the validation schema)
+    start_datetime = parse_start_datetime(date_str, start_time)
     end_datetime = start_datetime + timedelta(days=1)
+    start_epoch = int(start_datetime.replace(tzinfo=timezone.utc).timestamp())
     timestamp = datetime.now(timezone.utc).isoformat()
 
-    # Update the event only if it exists and belongs to the user
-    response = events_table.update_item(
-        Key={"id": event_id},
-        UpdateExpression=(
-            "SET #name = :name, city = :city, startdate = :startdate, "
-            "enddate = :enddate, entry_fee = :entry_fee, "
-            "checkpoints = :checkpoints, trace = :trace, "
-            "updated_at = :updated_at, name_lower = :name_lower, "
-            "city_lower = :city_lower, km_long = :km_long"
-        ),
-        ConditionExpression="user_id = :user_id AND attribute_not_exists(deleted_at)",
-        ExpressionAttributeNames={"#name": "name"},
-        ExpressionAttributeValues={
-            ":name": name,
-            ":city": city,
-            ":km_long": km_long,
-            ":startdate": start_datetime.isoformat(),
-            ":enddate": end_datetime.isoformat(),
-            ":entry_fee": entry_fee,
-            ":checkpoints": checkpoints,
-            ":trace": trace_points,
-            ":updated_at": timestamp,
-            ":user_id": user_id,
-            ":name_lower": name_lower,
-            ":city_lower": city_lower,
-        },
-        ReturnValues="ALL_NEW",
-    )
-
-    if not response.get("Attributes"):
-        return http_response(
-            404,
-            {
-                "status": "error",
-                "message": "Event not found or you are not authorized to edit it",
+    # Prefixes too short for the search indexes are removed instead of set
+    prefixes = search_prefixes(name_lower, city_lower)
+    prefix_update = "".join(f", {attr} = :{attr}" for attr in prefixes)
+    removed_prefixes = [
+        attr for attr in ("name_prefix", "city_prefix") if attr not in prefixes
+    ]
+    if removed_prefixes:
+        prefix_update += " REMOVE " + ", ".join(removed_prefixes)
+
+    # Ownership check and update in a single conditional write
+    try:
+        events_table.update_item(
+            Key={"id": event_id},
+            UpdateExpression=(
+                "SET #name = :name, city = :city, startdate = :startdate, "
+                "enddate = :enddate, entry_fee = :entry_fee, "
+                "checkpoints = :checkpoints, trace = :trace, "
+                "updated_at = :updated_at, name_lower = :name_lower, "
+                "city_lower = :city_lower, km_long = :km_long, "
+                "startdate_epoch = :startdate_epoch, enddate_epoch = :enddate_epoch"
+                + prefix_update
+            ),
+            ConditionExpression=(
+                "user_id = :user_id AND attribute_not_exists(deleted_at)"
+            ),
+            ExpressionAttributeNames={"#name": "name"},
+            ExpressionAttributeValues={
+                ":name": name,
+                ":city": city,
+                ":km_long": km_long,
+                ":startdate": start_datetime.isoformat(),
+                ":enddate": end_datetime.isoformat(),
+                ":startdate_epoch": start_epoch,
+                ":enddate_epoch": start_epoch + 24 * 60 * 60,
+                ":entry_fee": entry_fee,
+                ":checkpoints": checkpoints,
+                ":trace": trace_points,
+                ":updated_at": timestamp,
+                ":user_id": user_id,
+                ":name_lower": name_lower,
+                ":city_lower": city_lower,
+                **{f":{attr}": value for attr, value in prefixes.items()},
             },
+            ReturnValues="NONE",
         )
+    except ClientError as e:
+        # Missing, deleted or owned by someone else
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return http_response(
+                404,
+                {
+                    "status": "error",
+                    "message": "Event not found or you are not authorized to edit it",
+                },
+            )
+
+        # Any other ClientError is handled by middleware
+        raise
 
     return http_response(
         200,
@@ -120,17 +154,13 @@ def lambda_handler(event, context):
     )
 
 
-def normalize_list(data_list):
-    """Convert float values in a list of dicts to Decimal."""
-
-    normalized = []
-    for item in data_list:
-        normalized_item = {}
-        for k, v in item.items():
-            if isinstance(v, float):
-                normalized_item[k] = Decimal(str(v))
-            else:
-                normalized_item[k] = v
-        normalized.append(normalized_item)
+def parse_start_datetime(date_str, start_time):
+    """Build datetime from YYYY-MM-DD and HH:MM strings without strptime."""
 
-    return normalized
+    return datetime(
+        int(date_str[:4]),
+        int(date_str[5:7]),
+        int(date_str[8:10]),
+        int(start_time[:2]),
+        int(start_time[3:5]),
+    )
@@ -3,31 +3,46 @@ Lambda function to save users run in event.
 """
 
 import os
-import json
+import orjson
 from decimal import Decimal
 from datetime import datetime, timezone
-import boto3
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb, dynamodb_client
+from middleware import (
+    middleware,
+    http_response,
+    get_user_id,
+    CORS_PREFLIGHT_RESPONSE,
+    normalize_list,
+    load_validator,
+)
 from validation_schema import schema, path_params_schema
 
 # Logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 EVENT_TICKETS_TABLE = os.environ.get("EVENT_TICKETS_TABLE")
 AVERAGE_STEPS_PER_KM = Decimal("1400")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 tickets_table = dynamodb.Table(EVENT_TICKETS_TABLE)
 
+# Converts Python values to attribute values for the low-level client
+serializer = TypeSerializer()
+
+# Validators generated at bundling time
+path_params_validator = load_validator(
+    path_params_schema, "compiled_path_params_validator"
+)
+validator = load_validator(schema)
+
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -38,17 +53,17 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle CORS preflight
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     headers = event.get("headers") or {}
     path_params = event.get("pathParameters") or {}
-    body = json.loads(event.get("body") or "{}")
+    raw_body = event.get("body")
+    body = orjson.loads(raw_body) if raw_body else {}
 
     # Validate schemas
-    validate(event=path_params, schema=path_params_schema)
-    validate(event=body, schema=schema)
+    path_params_validator(path_params)
+    validator(body)
 
     event_id = path_params.get("event_id")
 
@@ -131,8 +146,12 @@ def lambda_handler(event, context):
         "finished_at": datetime.now(timezone.utc).isoformat(),
     }
 
-    set_details_in_event(event_id, run_details)
-    mark_ticket_as_used(ticket_id)
+    # Spend the ticket and record the run together, concurrent finishes can't
+    # record two runs and a failed write can't burn the ticket
+    if not record_run(ticket_id, event_id, run_details):
+        return http_response(
+            400, {"status": "error", "message": "Event ticket has already been used"}
+        )
 
     return http_response(
         200,
@@ -144,22 +163,6 @@ def lambda_handler(event, context):
     )
 
 
-def normalize_list(data_list):
-    """Convert float values in a list of dicts to Decimal."""
-
-    normalized = []
-    for item in data_list:
-        normalized_item = {}
-        for k, v in item.items():
-            if isinstance(v, float):
-                normalized_item[k] = Decimal(str(v))
-            else:
-                normalized_item[k] = v
-        normalized.append(normalized_item)
-
-    return normalized
-
-
 def get_event(event_id):
     """Retrieve event from DynamoDB by ID."""
 
@@ -230,27 +233,58 @@ def check_checkpoints(event, checkpoints: list) -> bool:
         return False
 
 
-def set_details_in_event(event_id: str, run_details: dict) -> None:
-    """Update the event item in DynamoDB with the run details."""
+def record_run(event_ticket_id: str, event_id: str, run_details: dict) -> bool:
+    """
+    Mark the event ticket as used and append the run details to the event in
+    one transaction, False if the ticket was already used.
+    """
 
-    events_table.update_item(
-        Key={"id": event_id},
-        UpdateExpression="SET runs = list_append(if_not_exists(runs, :empty_list), :new_run)",
-        ExpressionAttributeValues={
-            ":new_run": [run_details],
-            ":empty_list": [],
-        },
-    )
+    try:
+        dynamodb_client.transact_write_items(
+            TransactItems=[
+                {
+                    "Update": {
+                        "TableName": EVENT_TICKETS_TABLE,
+                        "Key": {"id": {"S": event_ticket_id}},
+                        "UpdateExpression": "SET is_used = :true",
+                        "ConditionExpression": (
+                            "attribute_not_exists(is_used) OR is_used = :false"
+                        ),
+                        "ExpressionAttributeValues": {
+                            ":true": {"BOOL": True},
+                            ":false": {"BOOL": False},
+                        },
+                    }
+                },
+                {
+                    "Update": {
+                        "TableName": EVENTS_TABLE,
+                        "Key": {"id": {"S": event_id}},
+                        "UpdateExpression": (
+                            "SET runs = list_append("
+                            "if_not_exists(runs, :empty_list), :new_run)"
+                        ),
+                        "ExpressionAttributeValues": {
+                            ":new_run": serializer.serialize([run_details]),
+                            ":empty_list": {"L": []},
+                        },
+                    }
+                },
+            ]
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+            raise
 
+        # Reasons are in TransactItems order, the first one is the ticket
+        reasons = e.response.get("CancellationReasons", [])
+        if reasons and reasons[0].get("Code") == "ConditionalCheckFailed":
+            return False
 
-def mark_ticket_as_used(event_ticket_id):
-    """Mark the event ticket as used in DynamoDB."""
+        # Any other cancellation is handled by middleware
+        raise
 
-    tickets_table.update_item(
-        Key={"id": event_ticket_id},
-        UpdateExpression="SET is_used = :val",
-        ExpressionAttributeValues={":val": True},
-    )
+    return True
 
 
 def get_event_ticket(event_ticket_id):
@@ -3,22 +3,25 @@ Lambda function to get users active events tickets.
 """
 
 import os
-import boto3
 from boto3.dynamodb.conditions import Key, Attr
 from aws_lambda_powertools import Logger
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+    get_user_id,
+    CORS_PREFLIGHT_RESPONSE,
+)
 
 # Logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 EVENT_TICKETS_TABLE = os.environ.get("EVENT_TICKETS_TABLE")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 tickets_table = dynamodb.Table(EVENT_TICKETS_TABLE)
 
 
@@ -31,9 +34,8 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle CORS preflight
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     headers = event.get("headers") or {}
 
@@ -3,29 +3,46 @@ Supports searching by name/city or filtering by geographic location.
 """
 
 import os
+import json
 import math
+import base64
+import binascii
 from decimal import Decimal
 from datetime import datetime, timedelta, timezone
-import boto3
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, Key
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+    CORS_PREFLIGHT_RESPONSE,
+    get_user_id,
+    SEARCH_PREFIX_LENGTH,
+    ACTIVE_EVENT_STATUS,
+    load_validator,
+    batch_get_chunked,
+)
 from validation_schema import schema
 
 # Configure logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
+ACTIVE_EVENTS_INDEX_READY = os.environ.get("ACTIVE_EVENTS_INDEX_READY") == "true"
+SEARCH_PREFIX_INDEXES_READY = os.environ.get("SEARCH_PREFIX_INDEXES_READY") == "true"
+
+# Upper bound for page size requested by clients
+MAX_LIMIT = 100
 
 # DynamoDB
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 
+# Validator generated at bundling time
+validator = load_validator(schema)
+
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -36,23 +53,25 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle preflight OPTIONS
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     query_params = event.get("queryStringParameters") or {}
     headers = event.get("headers") or {}
 
     # Validate request
-    validate(event=query_params, schema=schema)
+    validator(query_params)
 
     user_id = get_user_id(headers)
     if not user_id:
         return http_response(401, {"status": "error", "message": "Unauthorized"})
 
     # Pagination
-    limit = int(query_params.get("limit", 30))
-    exclusive_start_key = query_params.get("next_token", None)
+    limit = min(max(int(query_params.get("limit", 30)), 1), MAX_LIMIT)
+    try:
+        exclusive_start_key = decode_next_token(query_params.get("next_token"))
+    except (binascii.Error, ValueError):
+        return http_response(400, {"status": "error", "message": "Invalid next_token"})
 
     # Search/filter parameters
     search = query_params.get("search")
@@ -75,18 +94,8 @@ def lambda_handler(event, context):
         total_count = len(events)
 
     else:
-        scan_kwargs = {
-            "FilterExpression": Attr("deleted_at").not_exists(),
-            "Limit": limit,
-        }
-        if exclusive_start_key:
-            scan_kwargs["ExclusiveStartKey"] = exclusive_start_key
-
         # Default: return latest events
-        response = events_table.scan(**scan_kwargs)
-
-        events = response.get("Items", [])
-        next_token = response.get("LastEvaluatedKey")
+        events, next_token = list_active_events(limit, exclusive_start_key)
         total_count = len(events)
 
     logger.info(f"Total events fetched: {total_count}")
@@ -99,22 +108,91 @@ def lambda_handler(event, context):
             "pagination": {
                 "limit": limit,
                 "total": total_count,
-                "next_token": next_token if next_token else None,
+                "next_token": encode_next_token(next_token),
             },
             "events": events,
         },
     )
 
 
+def encode_next_token(last_evaluated_key):
+    """Encode a DynamoDB LastEvaluatedKey as an opaque URL-safe cursor."""
+
+    if not last_evaluated_key:
+        return None
+
+    raw = json.dumps(last_evaluated_key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_next_token(next_token):
+    """Decode a cursor produced by encode_next_token back to a start key."""
+
+    if not next_token:
+        return None
+
+    start_key = json.loads(base64.urlsafe_b64decode(next_token.encode()))
+    if not isinstance(start_key, dict):
+        raise ValueError("next_token must encode an object")
+
+    return start_key
+
+
+def list_active_events(limit, exclusive_start_key):
+    """
+    List events that are not deleted, newest first from active_events-index.
+    Until event_status is backfilled on older events the table is scanned.
+    """
+
+    if not ACTIVE_EVENTS_INDEX_READY:
+        scan_kwargs = {
+            "FilterExpression": Attr("deleted_at").not_exists(),
+            "Limit": limit,
+        }
+        if exclusive_start_key:
+            scan_kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+        response = events_table.scan(**scan_kwargs)
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+    # Deleted events are not in the sparse index
+    query_kwargs = {
+        "IndexName": "active_events-index",
+        "KeyConditionExpression": Key("event_status").eq(ACTIVE_EVENT_STATUS),
+        "ScanIndexForward": False,
+        "Limit": limit,
+    }
+    if exclusive_start_key:
+        query_kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+    response = events_table.query(**query_kwargs)
+    return response.get("Items", []), response.get("LastEvaluatedKey")
+
+
 # -----------------------------------------------
-# 🔍 Search by city or name (uses GSI or scan)
+# 🔍 Search by city or name (prefix GSIs or scan)
 # -----------------------------------------------
+SEARCH_INDEXES = {
+    "city": ("city_prefix-index", "city_prefix", "city_lower"),
+    "name": ("name_prefix-index", "name_prefix", "name_lower"),
+}
+
+
 def search_events(search, limit, exclusive_start_key):
-    """Search events by partial match on name or city."""
+    """Search events by name or city, on the prefix indexes once they are ready."""
 
     search_lower = search.lower()
 
-    # If user provides a city name, use GSI for efficiency
+    # Text shorter than the index prefix can't pick a partition, scan for it
+    if not SEARCH_PREFIX_INDEXES_READY or len(search_lower) < SEARCH_PREFIX_LENGTH:
+        return scan_search_events(search_lower, limit, exclusive_start_key)
+
+    return search_events_by_prefix(search_lower, limit, exclusive_start_key)
+
+
+def scan_search_events(search_lower, limit, exclusive_start_key):
+    """Search events by partial match on name or city with a table scan."""
+
     scan_kwargs = {
         "FilterExpression": (
             Attr("deleted_at").not_exists()
@@ -125,7 +203,6 @@ def search_events(search, limit, exclusive_start_key):
         ),
         "Limit": limit,
     }
-
     if exclusive_start_key:
         scan_kwargs["ExclusiveStartKey"] = exclusive_start_key
 
@@ -134,6 +211,64 @@ def search_events(search, limit, exclusive_start_key):
     return response.get("Items", []), response.get("LastEvaluatedKey")
 
 
+def search_events_by_prefix(search_lower, limit, exclusive_start_key):
+    """
+    Search events whose city or name starts with the given text. The indexes
+    are read one after the other, each query asks only for what is left of the
+    page, so the page never exceeds limit and the next token resumes exactly
+    after the last returned event. An event matching on both city and name is
+    only returned from the city index.
+    """
+
+    prefix = search_lower[:SEARCH_PREFIX_LENGTH]
+
+    events = []
+    next_keys = {}
+    earlier_matches = []
+
+    for field, (index_name, prefix_attr, sort_attr) in SEARCH_INDEXES.items():
+        # Events already matched by an earlier index are filtered out here
+        filter_expr = Attr("deleted_at").not_exists()
+        for earlier_match in earlier_matches:
+            filter_expr = filter_expr & ~earlier_match
+        earlier_matches.append(Attr(sort_attr).begins_with(search_lower))
+
+        # On later pages, indexes missing from the token are already exhausted
+        if exclusive_start_key and field not in exclusive_start_key:
+            continue
+        start_key = exclusive_start_key.get(field) if exclusive_start_key else None
+
+        # Page already full, this index starts where it stands on the next page
+        if len(events) >= limit:
+            next_keys[field] = start_key
+            continue
+
+        query_kwargs = {
+            "IndexName": index_name,
+            "KeyConditionExpression": (
+                Key(prefix_attr).eq(prefix) & Key(sort_attr).begins_with(search_lower)
+            ),
+            "FilterExpression": filter_expr,
+        }
+
+        while True:
+            query_kwargs["Limit"] = limit - len(events)
+            if start_key:
+                query_kwargs["ExclusiveStartKey"] = start_key
+
+            response = events_table.query(**query_kwargs)
+            events.extend(response.get("Items", []))
+
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key or len(events) >= limit:
+                break
+
+        if start_key:
+            next_keys[field] = start_key
+
+    return events, next_keys or None
+
+
 # TODO: for large scale this needs to be handled correctly
 # -----------------------------------------------
 # 📍 Geo-based filtering (100 km radius)
@@ -177,29 +312,59 @@ def fetch_events_within_bounds(lat, lng, limit, show_upcoming_events):
             & Attr("enddate").lte(one_month_later_iso)
         )
 
+    # Only read what the bounding-box check needs, full items are fetched later
     scan_kwargs = {
         "FilterExpression": filter_expr,
+        "ProjectionExpression": "#id, checkpoints",
+        "ExpressionAttributeNames": {"#id": "id"},
     }
 
-    response = events_table.scan(**scan_kwargs)
-    items = response.get("Items", [])
-    results = []
-
-    for event in items:
-        checkpoints = event.get("checkpoints", [])
-        for cp in checkpoints:
-            try:
-                lat_cp = Decimal(str(cp.get("lat", 0)))
-                lng_cp = Decimal(str(cp.get("lng", 0)))
-            except (ValueError, TypeError):
-                continue
-
-            if min_lat <= lat_cp <= max_lat and min_lng <= lng_cp <= max_lng:
-                results.append(event)
-                break  # Found one checkpoint in range → keep the event
-
-        if len(results) >= limit:
+    matched_ids = []
+
+    # Follow LastEvaluatedKey so matches past the 1 MB page cap are not lost,
+    # and stop reading as soon as enough events have been found
+    while len(matched_ids) < limit:
+        response = events_table.scan(**scan_kwargs)
+
+        for event in response.get("Items", []):
+            if event_in_bounds(event, min_lat, max_lat, min_lng, max_lng):
+                matched_ids.append(event["id"])
+                if len(matched_ids) >= limit:
+                    break
+
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if not last_evaluated_key:
             break
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    results = get_events_by_ids(matched_ids)
 
     logger.info(f"Found {len(results)} events within bounds.")
-    return results[:limit]
+    return results
+
+
+def event_in_bounds(event, min_lat, max_lat, min_lng, max_lng):
+    """Check whether any checkpoint of the event falls inside the bounding box."""
+
+    for cp in event.get("checkpoints", []):
+        try:
+            lat_cp = Decimal(str(cp.get("lat", 0)))
+            lng_cp = Decimal(str(cp.get("lng", 0)))
+        except (ValueError, TypeError):
+            continue
+
+        if min_lat <= lat_cp <= max_lat and min_lng <= lng_cp <= max_lng:
+            return True
+
+    return False
+
+
+def get_events_by_ids(event_ids):
+    """Fetch full event items with BatchGetItem, keeping the order of event_ids."""
+
+    keys = [{"id": event_id} for event_id in event_ids]
+    found = {
+        item["id"]: item for item in batch_get_chunked(dynamodb, EVENTS_TABLE, keys)
+    }
+
+    return [found[event_id] for event_id in event_ids if event_id in found]
@@ -4,22 +4,48 @@ Handles error catching, logging, and CORS responses.
 """
 
 import os
-import json
-import boto3
+import time
+import base64
+import hashlib
+import importlib
+from decimal import Decimal
+from datetime import datetime, timezone
+import orjson
+import fastjsonschema
+from cachetools import TLRUCache
+from fastjsonschema import JsonSchemaException
 from aws_lambda_powertools.middleware_factory import lambda_handler_decorator
 from aws_lambda_powertools.utilities.validation import SchemaValidationError
 from aws_lambda_powertools import Logger
 from botocore.exceptions import ClientError
 
+# pylint: disable=import-error
+from aws_clients import cognito_client
+
 # Configure logging
 logger = Logger()
 
-# Clients
-cognito_client = boto3.client("cognito-idp")
+# Cache of access token hash -> (user id, token exp), an entry lives for
+# 5 minutes at most and never past the expiry of its token
+USER_ID_CACHE = TLRUCache(
+    maxsize=1024,
+    ttu=lambda _key, value, now: min(now + 300, value[1]),
+    timer=time.time,
+)
 
 # Environment variables
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
+# Number of leading characters of name/city used as search index partition
+SEARCH_PREFIX_LENGTH = 2
+
+# Partition value of the sparse active_events-index, removed on soft delete
+ACTIVE_EVENT_STATUS = "active"
+
+# BatchGetItem limits
+BATCH_GET_SIZE = 100
+BATCH_GET_MAX_RETRIES = 5
+
 # Default headers
 BASE_HEADERS = {
     "Access-Control-Allow-Origin": ALLOWED_ORIGIN,
@@ -47,7 +73,7 @@ def middleware(handler, event, context):
     except ClientError as e:
         return _handle_client_error(e, context)
 
-    except SchemaValidationError as e:
+    except (SchemaValidationError, JsonSchemaException) as e:
         logger.warning(
             "schema validation failed",
             extra={"status": "error", "reason": "schema_failed"},
@@ -124,12 +150,13 @@ def _handle_client_error(e, context):
 def http_response(status, body, extra_headers=None, multi_value_headers=None):
     """Construct HTTP response with standard headers."""
 
-    headers = {**BASE_HEADERS, **(extra_headers or {})}
+    # Share BASE_HEADERS when nothing is added, API Gateway never mutates it
+    headers = {**BASE_HEADERS, **extra_headers} if extra_headers else BASE_HEADERS
 
     resp = {
         "statusCode": status,
         "headers": headers,
-        "body": json.dumps(body, default=str),
+        "body": orjson.dumps(body, default=str).decode(),
     }
 
     if multi_value_headers:
@@ -138,22 +165,29 @@ def http_response(status, body, extra_headers=None, multi_value_headers=None):
     return resp
 
 
-def cors_response(method):
-    """Handle CORS preflight requests."""
+# Prebuilt preflight response, it never changes between invocations
+CORS_PREFLIGHT_RESPONSE = http_response(
+    200,
+    "",
+    extra_headers={
+        "Access-Control-Allow-Headers": (
+            "Content-Type,Authorization,Access_token,access_token"
+        ),
+        "Access-Control-Allow-Methods": ("OPTIONS,GET,POST,PUT,DELETE,PATCH"),
+    },
+)
 
-    if method == "OPTIONS":
-        return http_response(
-            200,
-            "",
-            extra_headers={
-                "Access-Control-Allow-Headers": (
-                    "Content-Type,Authorization,Access_token,access_token"
-                ),
-                "Access-Control-Allow-Methods": ("OPTIONS,GET,POST,PUT,DELETE,PATCH"),
-            },
-        )
 
-    return None
+def load_validator(schema: dict, module: str = "compiled_validator"):
+    """
+    Return the validator generated by build_validators.py at bundling time,
+    falling back to compiling the schema when running from source.
+    """
+
+    try:
+        return importlib.import_module(module).validate
+    except ImportError:
+        return fastjsonschema.compile(schema)
 
 
 def get_user_id(headers):
@@ -178,6 +212,12 @@ def get_user_id(headers):
         )
         return None
 
+    # Reuse the user id resolved by an earlier invocation of this container
+    cache_key = hashlib.blake2b(access_token.encode(), digest_size=16).hexdigest()
+    cached = USER_ID_CACHE.get(cache_key)
+    if cached:
+        return cached[0]
+
     # Call Cognito to get user info
     response = cognito_client.get_user(AccessToken=access_token)
 
@@ -188,5 +228,102 @@ def get_user_id(headers):
 
     # Extract user id
     user_id = user_attributes.get("sub")
+    expires_at = token_expiry(access_token)
+    if user_id and expires_at is not None:
+        USER_ID_CACHE[cache_key] = (user_id, expires_at)
 
     return user_id
+
+
+def token_expiry(access_token: str):
+    """
+    Read the exp claim of an access token without verifying it, Cognito has
+    already validated the token. Returns None when the claim can't be read.
+    """
+
+    try:
+        payload = access_token.split(".")[1]
+        padded = payload + "=" * (-len(payload) % 4)
+        return float(orjson.loads(base64.urlsafe_b64decode(padded))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        # Malformed base64 and JSON both raise ValueError subclasses
+        return None
+
+
+def is_event_active(event):
+    """Check if the event is currently running based on its start and end dates."""
+
+    now = time.time()
+
+    # Events stored with epoch timestamps need no datetime parsing
+    if "startdate_epoch" in event and "enddate_epoch" in event:
+        return event["startdate_epoch"] <= now <= event["enddate_epoch"]
+
+    # Older events only have ISO strings, naive ones are treated as UTC
+    startdate = datetime.fromisoformat(event["startdate"])
+    enddate = datetime.fromisoformat(event["enddate"])
+
+    if startdate.tzinfo is None:
+        startdate = startdate.replace(tzinfo=timezone.utc)
+    if enddate.tzinfo is None:
+        enddate = enddate.replace(tzinfo=timezone.utc)
+
+    return startdate.timestamp() <= now <= enddate.timestamp()
+
+
+def batch_get_chunked(resource, table_name, keys):
+    """
+    Get items from a DynamoDB table with BatchGetItem, 100 keys per request.
+    Unprocessed keys are retried with exponential backoff.
+    """
+
+    items = []
+    for i in range(0, len(keys), BATCH_GET_SIZE):
+        request_items = {table_name: {"Keys": keys[i : i + BATCH_GET_SIZE]}}
+
+        for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+            response = resource.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(table_name, []))
+
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+
+            if attempt == BATCH_GET_MAX_RETRIES:
+                raise RuntimeError(
+                    f"{len(request_items[table_name]['Keys'])} keys left unprocessed"
+                )
+
+            # Back off before retrying throttled reads
+            time.sleep(min(0.05 * 2**attempt, 1.0))
+
+    return items
+
+
+def search_prefixes(name_lower: str, city_lower: str) -> dict:
+    """
+    Search index keys of an event. A name or city shorter than
+    SEARCH_PREFIX_LENGTH gets no prefix and stays out of its sparse index,
+    searches that short are served by a scan instead.
+    """
+
+    prefixes = {}
+    for attr, value in (("name_prefix", name_lower), ("city_prefix", city_lower)):
+        if len(value) >= SEARCH_PREFIX_LENGTH:
+            prefixes[attr] = value[:SEARCH_PREFIX_LENGTH]
+
+    return prefixes
+
+
+# pylint: disable=unidiomatic-typecheck
+def normalize_list(data_list):
+    """Convert float values in a list of dicts to Decimal."""
+
+    return [
+        (
+            {k: Decimal(str(v)) if type(v) is float else v for k, v in item.items()}
+            if any(type(v) is float for v in item.values())
+            else item
+        )
+        for item in data_list
+    ]
@@ -3,28 +3,40 @@ Lambda function to spend bought event ticket on a run
 """
 
 import os
-from datetime import datetime, timezone
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+    get_user_id,
+    is_event_active,
+    CORS_PREFLIGHT_RESPONSE,
+    load_validator,
+)
 from validation_schema import path_params_schema
 
 # Logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 EVENTS_TABLE = os.environ.get("EVENTS_TABLE")
 EVENT_TICKETS_TABLE = os.environ.get("EVENT_TICKETS_TABLE")
 
 # DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 events_table = dynamodb.Table(EVENTS_TABLE)
 tickets_table = dynamodb.Table(EVENT_TICKETS_TABLE)
 
+# Runs the independent Cognito and DynamoDB lookups side by side
+executor = ThreadPoolExecutor(max_workers=2)
+
+# Validator generated at bundling time
+path_params_validator = load_validator(
+    path_params_schema, "compiled_path_params_validator"
+)
+
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -35,15 +47,14 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle CORS preflight
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     headers = event.get("headers") or {}
     path_params = event.get("pathParameters") or {}
 
     # Validate schema
-    validate(event=path_params, schema=path_params_schema)
+    path_params_validator(path_params)
 
     # Get event ticket details
     event_ticket_id = path_params.get("event_ticket_id")
@@ -53,16 +64,20 @@ def lambda_handler(event, context):
             404, {"status": "error", "message": "Event ticket not found"}
         )
 
+    # Resolve the user and fetch the event concurrently
+    event_id = ticket["event_id"]
+    user_future = executor.submit(get_user_id, headers)
+    event_future = executor.submit(get_event, event_id)
+
     # Verify user
-    user_id = get_user_id(headers)
+    user_id = user_future.result()
     if not user_id:
         return http_response(
             401, {"status": "error", "message": "Unauthorized - missing access token"}
         )
 
     # Get event details
-    event_id = ticket["event_id"]
-    event = get_event(event_id)
+    event = event_future.result()
     if not event:
         return http_response(404, {"status": "error", "message": "Event not found"})
 
@@ -100,40 +115,24 @@ def lambda_handler(event, context):
 def get_event_ticket(event_ticket_id):
     """Retrieve event ticket from DynamoDB by ID."""
 
-    response = tickets_table.get_item(Key={"id": event_ticket_id})
+    response = tickets_table.get_item(
+        Key={"id": event_ticket_id},
+        ProjectionExpression="#u, user_id, event_id",
+        ExpressionAttributeNames={"#u": "is_used"},
+    )
     return response.get("Item")
 
 
 def get_event(event_id):
     """Retrieve event from DynamoDB by ID."""
 
-    response = events_table.get_item(Key={"id": event_id})
+    response = events_table.get_item(
+        Key={"id": event_id},
+        ProjectionExpression="startdate, enddate, startdate_epoch, enddate_epoch",
+    )
     return response.get("Item")
 
 
-def is_event_active(event):
-    """Check if the event is currently active based on start and end dates."""
-
-    startdate = datetime.fromisoformat(event["startdate"])
-    enddate = datetime.fromisoformat(event["enddate"])
-
-    # Ensure they are aware in UTC
-    if startdate.tzinfo is None:
-        startdate = startdate.replace(tzinfo=timezone.utc)
-    else:
-        startdate = startdate.astimezone(timezone.utc)
-
-    if enddate.tzinfo is None:
-        enddate = enddate.replace(tzinfo=timezone.utc)
-    else:
-        enddate = enddate.astimezone(timezone.utc)
-
-    # Current UTC time
-    now = datetime.now(timezone.utc)
-
-    return startdate <= now <= enddate
-
-
 def is_ticket_owned_by_user(ticket, user_id):
     """Check if the ticket is owned by the given user ID."""
 
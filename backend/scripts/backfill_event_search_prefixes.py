@@ -0,0 +1,116 @@
+"""
+One-off backfill of the search attributes (name_lower, city_lower,
+name_prefix, city_prefix) on events created before city_prefix-index and
+name_prefix-index existed. Values shorter than the prefix length stay out of
+the sparse indexes, the same as searches shorter than it are rejected.
+"""
+
+import argparse
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# Matches SEARCH_PREFIX_LENGTH in events/middleware.py
+SEARCH_PREFIX_LENGTH = 2
+
+
+def search_attributes(field, value):
+    """Lowercased value and its prefix, the prefix only when long enough."""
+
+    lower = value.lower()
+    attributes = {f"{field}_lower": lower}
+    if len(lower) >= SEARCH_PREFIX_LENGTH:
+        attributes[f"{field}_prefix"] = lower[:SEARCH_PREFIX_LENGTH]
+
+    return attributes
+
+
+def backfill_event_search_prefixes(table_name, region=None, dry_run=False):
+    """Set the search attributes on every live event that is missing them."""
+
+    table = boto3.resource("dynamodb", region_name=region).Table(table_name)
+
+    scan_kwargs = {
+        "FilterExpression": Attr("deleted_at").not_exists()
+        & (Attr("name_prefix").not_exists() | Attr("city_prefix").not_exists()),
+        # name is a DynamoDB reserved word
+        "ProjectionExpression": "id, #name, city",
+        "ExpressionAttributeNames": {"#name": "name"},
+    }
+
+    updated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+
+        for item in response.get("Items", []):
+            name = item.get("name")
+            city = item.get("city")
+            if not isinstance(name, str) or not isinstance(city, str):
+                print(f"⚠️ Event {item['id']} has no name or city, skipped")
+                continue
+
+            attributes = {
+                **search_attributes("name", name),
+                **search_attributes("city", city),
+            }
+
+            if dry_run:
+                print(f"Would set {attributes} on event {item['id']}")
+                updated += 1
+                continue
+
+            try:
+                table.update_item(
+                    Key={"id": item["id"]},
+                    UpdateExpression="SET "
+                    + ", ".join(f"{key} = :{key}" for key in attributes),
+                    # Skip events deleted or edited since the scan read them
+                    ConditionExpression=(
+                        "attribute_exists(id) "
+                        "AND attribute_not_exists(deleted_at) "
+                        "AND #name = :name AND city = :city"
+                    ),
+                    ExpressionAttributeNames={"#name": "name"},
+                    ExpressionAttributeValues={
+                        ":name": name,
+                        ":city": city,
+                        **{f":{key}": value for key, value in attributes.items()},
+                    },
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    print(f"✅ {updated} events backfilled with search attributes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill the search prefixes on live events for the "
+        "city_prefix-index and name_prefix-index"
+    )
+    parser.add_argument(
+        "--table",
+        "-t",
+        required=True,
+        help="Physical name of the events DynamoDB table",
+    )
+    parser.add_argument(
+        "--region",
+        "-r",
+        default=None,
+        help="AWS region of the table (default: from the AWS config)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the events that would be updated",
+    )
+
+    args = parser.parse_args()
+    backfill_event_search_prefixes(args.table, args.region, args.dry_run)
@@ -0,0 +1,84 @@
+"""
+One-off backfill of event_status on events created before the
+active_events-index existed. Only events that are not soft deleted are
+marked active, deleted ones must stay out of the sparse index.
+"""
+
+import argparse
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# Matches ACTIVE_EVENT_STATUS in events/middleware.py
+ACTIVE_EVENT_STATUS = "active"
+
+
+def backfill_event_status(table_name, region=None, dry_run=False):
+    """Set event_status on every live event that does not have it yet."""
+
+    table = boto3.resource("dynamodb", region_name=region).Table(table_name)
+
+    scan_kwargs = {
+        "FilterExpression": Attr("deleted_at").not_exists()
+        & Attr("event_status").not_exists(),
+        "ProjectionExpression": "id",
+    }
+
+    updated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+
+        for item in response.get("Items", []):
+            if dry_run:
+                print(f"Would mark event {item['id']} active")
+                updated += 1
+                continue
+
+            try:
+                table.update_item(
+                    Key={"id": item["id"]},
+                    UpdateExpression="SET event_status = :status",
+                    # Skip events deleted or backfilled since the scan read them
+                    ConditionExpression=(
+                        "attribute_exists(id) "
+                        "AND attribute_not_exists(deleted_at) "
+                        "AND attribute_not_exists(event_status)"
+                    ),
+                    ExpressionAttributeValues={":status": ACTIVE_EVENT_STATUS},
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    print(f"✅ {updated} events marked {ACTIVE_EVENT_STATUS}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill event_status on live events for active_events-index"
+    )
+    parser.add_argument(
+        "--table",
+        "-t",
+        required=True,
+        help="Physical name of the events DynamoDB table",
+    )
+    parser.add_argument(
+        "--region",
+        "-r",
+        default=None,
+        help="AWS region of the table (default: from the AWS config)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the events that would be updated",
+    )
+
+    args = parser.parse_args()
+    backfill_event_status(args.table, args.region, args.dry_run)
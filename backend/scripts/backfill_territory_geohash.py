@@ -0,0 +1,119 @@
+"""
+One-off backfill of center_lat, center_lng and geohash on territories stored
+before geohash-index existed. The values are computed the same way as in
+assignterritoriestouser, from the left top and right bottom corners.
+Run it with the packages from territories/requirements.txt installed.
+"""
+
+import os
+import sys
+import argparse
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# Encode with the territories middleware itself so backfilled cells always
+# match the ones the listing queries
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "territories")
+)
+# pylint: disable=import-error,wrong-import-position
+from middleware import TERRITORY_COUNTER_PREFIX, geohash_encode
+
+CORNER_FIELDS = (
+    "left_top_corner_lat",
+    "left_top_corner_lng",
+    "right_bottom_corner_lat",
+    "right_bottom_corner_lng",
+)
+
+
+def backfill_territory_geohash(table_name, region=None, dry_run=False):
+    """Set the center and geohash on every territory that does not have them."""
+
+    table = boto3.resource("dynamodb", region_name=region).Table(table_name)
+
+    # Counter items share the table but are not territories
+    scan_kwargs = {
+        "FilterExpression": Attr("geohash").not_exists()
+        & ~Attr("square_key").begins_with(TERRITORY_COUNTER_PREFIX),
+        "ProjectionExpression": "square_key, " + ", ".join(CORNER_FIELDS),
+    }
+
+    updated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+
+        for item in response.get("Items", []):
+            if any(field not in item for field in CORNER_FIELDS):
+                print(f"⚠️ Territory {item['square_key']} has no corners, skipped")
+                continue
+
+            center_lat = (
+                item["left_top_corner_lat"] + item["right_bottom_corner_lat"]
+            ) / 2
+            center_lng = (
+                item["left_top_corner_lng"] + item["right_bottom_corner_lng"]
+            ) / 2
+            geohash = geohash_encode(center_lat, center_lng)
+
+            if dry_run:
+                print(f"Would set geohash {geohash} on {item['square_key']}")
+                updated += 1
+                continue
+
+            try:
+                table.update_item(
+                    Key={"square_key": item["square_key"]},
+                    UpdateExpression=(
+                        "SET center_lat = :center_lat, center_lng = :center_lng, "
+                        "geohash = :geohash"
+                    ),
+                    # Skip territories rewritten by an upsert since the scan
+                    ConditionExpression=(
+                        "attribute_exists(square_key) "
+                        "AND attribute_not_exists(geohash)"
+                    ),
+                    ExpressionAttributeValues={
+                        ":center_lat": center_lat,
+                        ":center_lng": center_lng,
+                        ":geohash": geohash,
+                    },
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    print(f"✅ {updated} territories backfilled with a geohash")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill center_lat, center_lng and geohash on territories "
+        "for geohash-index"
+    )
+    parser.add_argument(
+        "--table",
+        "-t",
+        required=True,
+        help="Physical name of the territories DynamoDB table",
+    )
+    parser.add_argument(
+        "--region",
+        "-r",
+        default=None,
+        help="AWS region of the table (default: from the AWS config)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the territories that would be updated",
+    )
+
+    args = parser.parse_args()
+    backfill_territory_geohash(args.table, args.region, args.dry_run)
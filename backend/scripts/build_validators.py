@@ -0,0 +1,52 @@
+"""
+Generate precompiled fastjsonschema validators for a bundled handler.
+Shared by every service, the bundling containers mount this directory and run
+it so each schema is turned into Python code at build time instead of on
+every cold start.
+"""
+
+import os
+import sys
+import argparse
+import fastjsonschema
+
+
+def compiled_module_name(schema_name):
+    """Module the handlers import through middleware.load_validator."""
+
+    return f"compiled_{schema_name.replace('schema', 'validator')}"
+
+
+def build_validators(handler_dir):
+    """
+    Compile every *schema dict of validation_schema from handler_dir into its
+    own Python module written next to it.
+    """
+
+    sys.path.insert(0, handler_dir)
+    import validation_schema  # pylint: disable=import-outside-toplevel
+
+    for name, schema in vars(validation_schema).items():
+        if not name.endswith("schema") or not isinstance(schema, dict):
+            continue
+
+        code = fastjsonschema.compile_to_code(schema)
+
+        output_path = os.path.join(handler_dir, f"{compiled_module_name(name)}.py")
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(code)
+
+        print(f"{output_path} generated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompile a handler's validation schemas with fastjsonschema."
+    )
+    parser.add_argument(
+        "handler_dir",
+        help="Directory containing validation_schema.py, usually /asset-output",
+    )
+
+    args = parser.parse_args()
+    build_validators(args.handler_dir)
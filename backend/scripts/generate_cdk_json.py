@@ -6,9 +6,14 @@ Supports TypeScript CDK apps via --typescript flag.
 
 import json
 import os
+import re
+import mmap
 import argparse
 from dotenv import load_dotenv
 
+# KEY=value lines, comments and blank lines never match
+ENV_LINE_PATTERN = re.compile(rb"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=(.*)$", re.M)
+
 
 def generate_cdk_json(
     env_path=None, output_path="cdk.json", keys=None, typescript=False
@@ -35,13 +40,7 @@ def generate_cdk_json(
         env_vars = {}
         if env_path and os.path.exists(env_path):
             # Parse .env manually to preserve only entries explicitly defined there
-            with open(env_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith("#") or "=" not in line:
-                        continue
-                    key, value = line.split("=", 1)
-                    env_vars[key.strip()] = value.strip()
+            env_vars = parse_env_file(env_path)
 
     # Determine CDK app command
     app_command = "npx ts-node bin/crypto.ts" if typescript else "python3.12 app.py"
@@ -61,6 +60,21 @@ def generate_cdk_json(
     print(f"CDK app command set to: {app_command}")
 
 
+def parse_env_file(env_path):
+    """Parse KEY=value entries from a .env file in a single regex pass."""
+
+    # mmap can't map an empty file
+    if os.path.getsize(env_path) == 0:
+        return {}
+
+    with open(env_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return {
+                key.decode("utf-8"): value.decode("utf-8").strip()
+                for key, value in ENV_LINE_PATTERN.findall(mm)
+            }
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Generate cdk.json file from environment variables or .env file"
@@ -4,23 +4,38 @@ Defines DynamoDB table, Lambda functions, and API Gateway.
 """
 
 import os
+import hashlib
 from aws_cdk import (
     App,
+    DockerVolume,
     Stack,
     CfnOutput,
     Duration,
+    AssetHashType,
+    IgnoreMode,
     aws_lambda as _lambda,
-    aws_apigateway as apigw,
+    aws_apigatewayv2 as apigwv2,
+    aws_apigatewayv2_integrations as apigwv2_integrations,
     aws_dynamodb as dynamodb,
     aws_iam as iam,
     RemovalPolicy,
 )
 from constructs import Construct
 
+# Host pip cache mounted into the bundling containers, wheels are reused across synths
+PIP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pip")
+
+# Shared build scripts (build_validators.py), mounted into the bundling containers
+BUILD_SCRIPTS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "scripts")
+)
+
 
 def lambda_bundling(directory: str):
     """Helper function for Lambda bundling configuration."""
 
+    os.makedirs(PIP_CACHE_DIR, exist_ok=True)
+
     return {
         "image": _lambda.Runtime.PYTHON_3_12.bundling_image,  # pylint: disable=no-member
         "command": [
@@ -28,14 +43,104 @@ def lambda_bundling(directory: str):
             "-c",
             (
                 f"cd {directory} && "
-                "pip install aws-lambda-powertools fastjsonschema -t /asset-output && "
-                "cp -r . /asset-output && "
-                "cp ../middleware.py /asset-output"
+                # Copy the handler without tests, docs or local caches
+                "tar -c --exclude=tests --exclude='test_*' --exclude='*.md' "
+                "--exclude=.venv --exclude=__pycache__ --exclude='*.pyc' . "
+                "| tar -x -C /asset-output && "
+                "cp ../middleware.py ../aws_clients.py /asset-output && "
+                # Turn the request schemas into Python code once, at build time
+                "if [ -f validation_schema.py ]; then "
+                "pip install fastjsonschema -q --cache-dir /pip-cache -t /tmp/build && "
+                "PYTHONPATH=/tmp/build "
+                "python /build-scripts/build_validators.py /asset-output; "
+                "fi && "
+                # Ship bytecode next to the modules, Lambda resolves the handler by .py
+                "python -m compileall -b -q /asset-output && "
+                "find /asset-output -name '*.py' -not -name 'lambda_handler.py' -delete"
+            ),
+        ],
+        "volumes": [
+            DockerVolume(host_path=PIP_CACHE_DIR, container_path="/pip-cache"),
+            DockerVolume(host_path=BUILD_SCRIPTS_DIR, container_path="/build-scripts"),
+        ],
+    }
+
+
+def asset_excludes(*paths: str):
+    """Gitignore-style excludes that keep only the given top-level paths."""
+
+    return ["/*", *[f"!/{path}" for path in paths], "__pycache__/", "*.pyc"]
+
+
+def lambda_code(directory: str):
+    """Asset for one handler, hashed over its own sources and the shared modules."""
+
+    return _lambda.Code.from_asset(
+        ".",
+        bundling=lambda_bundling(directory),
+        exclude=asset_excludes(directory, "middleware.py", "aws_clients.py"),
+        ignore_mode=IgnoreMode.GIT,
+    )
+
+
+def layer_bundling():
+    """Helper function for the shared dependencies layer bundling configuration."""
+
+    os.makedirs(PIP_CACHE_DIR, exist_ok=True)
+
+    return {
+        "image": _lambda.Runtime.PYTHON_3_12.bundling_image,  # pylint: disable=no-member
+        "command": [
+            "bash",
+            "-c",
+            (
+                # Resolve arm64 wheels without emulating arm64 in the build container
+                "pip install -r requirements.txt -t /asset-output/python "
+                "--platform manylinux2014_aarch64 --platform manylinux_2_28_aarch64 "
+                "--only-binary=:all: --python-version 3.12 --cache-dir /pip-cache && "
+                # Drop files the functions never load before shipping the layer
+                "find /asset-output/python -depth -type d "
+                "\\( -name '__pycache__' -o -name 'tests' \\) -exec rm -rf {} + && "
+                "find /asset-output/python -name '*.pyi' -delete && "
+                # Lambda can't write __pycache__ at runtime, so compile ahead of time
+                "python -m compileall -q --invalidation-mode unchecked-hash "
+                "/asset-output/python"
             ),
         ],
+        "volumes": [
+            DockerVolume(host_path=PIP_CACHE_DIR, container_path="/pip-cache")
+        ],
     }
 
 
+def layer_asset_hash(path: str = "requirements.txt") -> str:
+    """Hash requirements and pip command so the layer rebuilds only on change."""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    digest.update(" ".join(layer_bundling()["command"]).encode())
+
+    return digest.hexdigest()
+
+
+def provisioned_alias(scope: Construct, construct_id: str, function: _lambda.Function):
+    """Live alias with provisioned concurrency that scales on utilization."""
+
+    alias = _lambda.Alias(
+        scope,
+        construct_id,
+        alias_name="live",
+        version=function.current_version,
+        provisioned_concurrent_executions=2,
+    )
+
+    scaling = alias.add_auto_scaling(min_capacity=2, max_capacity=10)
+    scaling.scale_on_utilization(utilization_target=0.7)
+
+    return alias
+
+
 class TerrastrideTerritoriesStack(Stack):
     """AWS CDK Stack for Terrastride Territories Service"""
 
@@ -49,6 +154,7 @@ class TerrastrideTerritoriesStack(Stack):
 
         # Logs Database:
         # PK: id (UUID as string)
+        # TTL: expires_at (epoch seconds), rows expire after the retention window
         frontend_logs_table = dynamodb.Table(
             self,
             "FrontendLogsTable",
@@ -57,12 +163,18 @@ class TerrastrideTerritoriesStack(Stack):
             ),
             sort_key=None,
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
             removal_policy=RemovalPolicy.DESTROY,
         )
 
         # Territories:
         # PK: id (UUID as string)
         # GSI: user_id-index -> partition user_id, sort created_at
+        # GSI: geohash-index -> partition geohash of the territory center, used
+        #      to list territories around a location without scanning the table
+        # DynamoDB takes one GSI change per table update. The count-only
+        # user_id-count-index is created in a later deploy, and user_id-index is
+        # dropped in the one after it, once nothing reads it
         territories_table = dynamodb.Table(
             self,
             "TerritoriesTable",
@@ -85,18 +197,51 @@ class TerrastrideTerritoriesStack(Stack):
             projection_type=dynamodb.ProjectionType.ALL,
         )
 
-        # IAM Policy for Lambda functions to access Cognito
-        cognito_policy = iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            actions=[
-                "cognito-idp:SignUp",
-                "cognito-idp:AdminConfirmSignUp",
-                "cognito-idp:InitiateAuth",
-                "cognito-idp:GetUser",
-                "cognito-idp:AdminGetUser",
-                "cognito-idp:AdminUpdateUserAttributes",
+        territories_table.add_global_secondary_index(
+            index_name="geohash-index",
+            partition_key=dynamodb.Attribute(
+                name="geohash", type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
+        # IAM Policy for Lambda functions to access Cognito, shared by all roles
+        cognito_policy = iam.ManagedPolicy(
+            self,
+            "CognitoAccessPolicy",
+            statements=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "cognito-idp:SignUp",
+                        "cognito-idp:AdminConfirmSignUp",
+                        "cognito-idp:InitiateAuth",
+                        "cognito-idp:GetUser",
+                        "cognito-idp:AdminGetUser",
+                        "cognito-idp:AdminUpdateUserAttributes",
+                    ],
+                    resources=[user_pool_arn],
+                )
             ],
-            resources=[user_pool_arn],
+        )
+
+        # Shared dependencies layer, pip runs once instead of once per function
+        deps_layer = _lambda.LayerVersion(
+            self,
+            "PowertoolsDepsLayer",
+            code=_lambda.Code.from_asset(
+                ".",
+                asset_hash_type=AssetHashType.CUSTOM,
+                asset_hash=layer_asset_hash(),
+                bundling=layer_bundling(),
+                exclude=asset_excludes("requirements.txt"),
+                ignore_mode=IgnoreMode.GIT,
+            ),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+            compatible_architectures=[_lambda.Architecture.ARM_64],
+            description=(
+                "aws-lambda-powertools, fastjsonschema and orjson for territories"
+            ),
         )
 
         # TODO: TEMPORARY FRONTEND LOGS TABLE
@@ -104,16 +249,16 @@ class TerrastrideTerritoriesStack(Stack):
             self,
             "FrontendLogsLambda",
             runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="lambda_handler.lambda_handler",
-            code=_lambda.Code.from_asset(
-                ".",
-                bundling=lambda_bundling("frontendlogs"),
-            ),
+            code=lambda_code("frontendlogs"),
             environment={
                 "POWERTOOLS_SERVICE_NAME": "territories",
                 "FRONTEND_LOGS_TABLE": frontend_logs_table.table_name,
             },
+            snap_start=_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS,
             timeout=Duration.seconds(30),
+            layers=[deps_layer],
         )
         frontend_logs_table.grant_read_write_data(fe_logs_lambda)
 
@@ -122,15 +267,15 @@ class TerrastrideTerritoriesStack(Stack):
             self,
             "HealthcheckLambda",
             runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="lambda_handler.lambda_handler",
-            code=_lambda.Code.from_asset(
-                ".",
-                bundling=lambda_bundling("healthcheck"),
-            ),
+            code=lambda_code("healthcheck"),
             environment={
                 "POWERTOOLS_SERVICE_NAME": "territories",
             },
+            snap_start=_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS,
             timeout=Duration.seconds(30),
+            layers=[deps_layer],
         )
 
         # List territories Lambda Function
@@ -138,50 +283,53 @@ class TerrastrideTerritoriesStack(Stack):
             self,
             "ListTerritoriesLambda",
             runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="lambda_handler.lambda_handler",
-            code=_lambda.Code.from_asset(
-                ".",
-                bundling=lambda_bundling("listterritories"),
-            ),
+            code=lambda_code("listterritories"),
             environment={
                 "POWERTOOLS_SERVICE_NAME": "territories",
                 "TERRITORIES_TABLE": territories_table.table_name,
+                "USER_POOL_ID": user_pool_id,
+                # Set to "true" once scripts/backfill_territory_geohash.py has run
+                "GEOHASH_BACKFILLED": "false",
             },
+            memory_size=1024,
             timeout=Duration.seconds(30),
+            layers=[deps_layer],
         )
 
         assign_territories_lambda = _lambda.Function(
             self,
             "AssignTerritoriesLambda",
             runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="lambda_handler.lambda_handler",
-            code=_lambda.Code.from_asset(
-                ".",
-                bundling=lambda_bundling("assignterritoriestouser"),
-            ),
+            code=lambda_code("assignterritoriestouser"),
             environment={
                 "POWERTOOLS_SERVICE_NAME": "territories",
                 "TERRITORIES_TABLE": territories_table.table_name,
                 "USER_POOL_ID": user_pool_id,
             },
+            memory_size=1024,
             timeout=Duration.seconds(30),
+            layers=[deps_layer],
         )
 
         mine_territory_coins_lambda = _lambda.Function(
             self,
             "MineTerritoryCoinsLambda",
             runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="lambda_handler.lambda_handler",
-            code=_lambda.Code.from_asset(
-                ".",
-                bundling=lambda_bundling("mineterritorycoins"),
-            ),
+            code=lambda_code("mineterritorycoins"),
             environment={
                 "POWERTOOLS_SERVICE_NAME": "territories",
                 "TERRITORIES_TABLE": territories_table.table_name,
                 "USER_POOL_ID": user_pool_id,
             },
+            memory_size=1024,
             timeout=Duration.seconds(30),
+            layers=[deps_layer],
         )
 
         # Grant Lambda read access to the DB secret
@@ -189,46 +337,116 @@ class TerrastrideTerritoriesStack(Stack):
         territories_table.grant_read_write_data(assign_territories_lambda)
         territories_table.grant_read_write_data(mine_territory_coins_lambda)
 
-        list_territories_lambda.add_to_role_policy(cognito_policy)
-        assign_territories_lambda.add_to_role_policy(cognito_policy)
-        mine_territory_coins_lambda.add_to_role_policy(cognito_policy)
+        list_territories_lambda.role.add_managed_policy(cognito_policy)
+        assign_territories_lambda.role.add_managed_policy(cognito_policy)
+        mine_territory_coins_lambda.role.add_managed_policy(cognito_policy)
+
+        # Pre-initialized environments for the user-facing endpoints
+        list_territories_alias = provisioned_alias(
+            self, "ListTerritoriesLiveAlias", list_territories_lambda
+        )
+        assign_territories_alias = provisioned_alias(
+            self, "AssignTerritoriesLiveAlias", assign_territories_lambda
+        )
+        mine_territory_coins_alias = provisioned_alias(
+            self, "MineTerritoryCoinsLiveAlias", mine_territory_coins_lambda
+        )
+
+        # SnapStart restores from published versions only, so invoke through aliases
+        healthcheck_alias = _lambda.Alias(
+            self,
+            "HealthcheckLiveAlias",
+            alias_name="live",
+            version=healthcheck_lambda.current_version,
+        )
+        fe_logs_alias = _lambda.Alias(
+            self,
+            "FrontendLogsLiveAlias",
+            alias_name="live",
+            version=fe_logs_lambda.current_version,
+        )
 
-        # API Gateway
-        api = apigw.RestApi(
+        # API Gateway (HTTP API)
+        api = apigwv2.HttpApi(
             self,
-            "TerrastrideTerritoriesApi",
-            rest_api_name="Terrastride Territories API",
+            "TerrastrideTerritoriesHttpApi",
+            api_name="Terrastride Territories API",
             description="Terrastride Territories Services API",
-            deploy=True,
-            deploy_options=apigw.StageOptions(stage_name="territories"),
-            default_cors_preflight_options=apigw.CorsOptions(
-                allow_origins=apigw.Cors.ALL_ORIGINS,
-                allow_methods=apigw.Cors.ALL_METHODS,
-                allow_headers=apigw.Cors.DEFAULT_HEADERS,
+            create_default_stage=False,
+            cors_preflight=apigwv2.CorsPreflightOptions(
+                allow_origins=["*"],
+                allow_methods=[apigwv2.CorsHttpMethod.ANY],
+                allow_headers=[
+                    "Content-Type",
+                    "X-Amz-Date",
+                    "Authorization",
+                    "X-Api-Key",
+                    "X-Amz-Security-Token",
+                    "X-Amz-User-Agent",
+                    # Header names are case-insensitive, covers Access_token too
+                    "access_token",
+                ],
             ),
         )
 
-        # API Gateway Integrations
-        healthcheck_integration = apigw.LambdaIntegration(healthcheck_lambda)
-        list_territories_integration = apigw.LambdaIntegration(list_territories_lambda)
-        assign_territories_integration = apigw.LambdaIntegration(
-            assign_territories_lambda
+        # Keep the /territories base path clients already use
+        api.add_stage("TerritoriesStage", stage_name="territories", auto_deploy=True)
+
+        # API Gateway Integrations, handlers read the compact 2.0 payload
+        payload_format_version = apigwv2.PayloadFormatVersion.VERSION_2_0
+        healthcheck_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "HealthcheckIntegration",
+            healthcheck_alias,
+            payload_format_version=payload_format_version,
+        )
+        list_territories_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "ListTerritoriesIntegration",
+            list_territories_alias,
+            payload_format_version=payload_format_version,
         )
-        mine_territory_coins_integration = apigw.LambdaIntegration(
-            mine_territory_coins_lambda
+        assign_territories_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "AssignTerritoriesIntegration",
+            assign_territories_alias,
+            payload_format_version=payload_format_version,
+        )
+        mine_territory_coins_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "MineTerritoryCoinsIntegration",
+            mine_territory_coins_alias,
+            payload_format_version=payload_format_version,
+        )
+        fe_logs_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "FrontendLogsIntegration",
+            fe_logs_alias,
+            payload_format_version=payload_format_version,
         )
 
-        # API Gateway Resources and Methods
-        api.root.add_resource("healthcheck").add_method("GET", healthcheck_integration)
-        api.root.add_resource("mine").add_method(
-            "POST", mine_territory_coins_integration
+        # API Gateway Routes
+        api.add_routes(
+            path="/healthcheck",
+            methods=[apigwv2.HttpMethod.GET],
+            integration=healthcheck_integration,
+        )
+        api.add_routes(
+            path="/mine",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=mine_territory_coins_integration,
+        )
+        api.add_routes(
+            path="/",
+            methods=[apigwv2.HttpMethod.GET],
+            integration=list_territories_integration,
+        )
+        api.add_routes(
+            path="/",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=assign_territories_integration,
         )
-        api.root.add_method("GET", list_territories_integration)
-        api.root.add_method("POST", assign_territories_integration)
 
         # TODO: logs API resource
-        api.root.add_resource("logs").add_method(
-            "POST", apigw.LambdaIntegration(fe_logs_lambda)
+        api.add_routes(
+            path="/logs",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=fe_logs_integration,
         )
 
         # Outputs
@@ -236,7 +454,7 @@ class TerrastrideTerritoriesStack(Stack):
             self,
             "TerrastrideTerritoriesApiEndpoint",
             description="Terrastride Territories API Gateway URL",
-            value=f"https://{api.rest_api_id}.execute-api.{self.region}.amazonaws.com/territories",
+            value=f"https://{api.api_id}.execute-api.{self.region}.amazonaws.com/territories",
         )
 
 
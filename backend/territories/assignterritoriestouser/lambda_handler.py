@@ -4,30 +4,63 @@ Lambda function to assign territory blocks from a run to user.
 
 from decimal import Decimal
 import os
-import json
+import orjson
 import datetime
 import hashlib
-import boto3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from boto3.dynamodb.conditions import Attr, Key
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
-import botocore
+from botocore.exceptions import ClientError
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id, Territory
+from aws_clients import dynamodb, dynamodb_client, cognito_client, warm_connection
+from middleware import (
+    middleware,
+    http_response,
+    load_validator,
+    get_user_id,
+    add_territory_counts,
+    get_territory_counter,
+    geohash_encode,
+    Territory,
+)
 from validation_schema import schema
 
 logger = Logger()
 
 # Environment
-AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 TERRITORIES_TABLE = os.environ.get("TERRITORIES_TABLE")
 
-# Clients
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
+# Territory attributes stored as DynamoDB numbers, missing values become 0
+DECIMAL_FIELDS = (
+    "average_pace",
+    "left_top_corner_lat",
+    "left_top_corner_lng",
+    "right_top_corner_lat",
+    "right_top_corner_lng",
+    "left_bottom_corner_lat",
+    "left_bottom_corner_lng",
+    "right_bottom_corner_lat",
+    "right_bottom_corner_lng",
+)
+ZERO = {"N": "0"}
+
+# A stored territory is only replaced by a run at a better (lower) pace
+UPSERT_CONDITION = "attribute_not_exists(square_key) OR average_pace > :average_pace"
+
+# DynamoDB client
 territories_table = dynamodb.Table(TERRITORIES_TABLE)
-cognito_client = boto3.client("cognito-idp", region_name=AWS_REGION)
+
+# Provisioned environments open the connection before the first request
+warm_connection(TERRITORIES_TABLE)
+
+# Conditional territory updates run side by side, up to eight at a time
+executor = ThreadPoolExecutor(max_workers=8)
+
+# Validator generated at bundling time
+validator = load_validator(schema)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -38,31 +71,43 @@ def lambda_handler(event, context):
     request_id = context.aws_request_id
     logger.append_keys(request_id=request_id)
 
-    # Handle CORS
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
-
-    event_body = json.loads(event.get("body") or "{}")
+    raw_body = event.get("body")
+    event_body = orjson.loads(raw_body) if raw_body else {}
     headers = event.get("headers") or {}
 
     # Validate request
     logger.info("Validating request")
-    validate(event=event_body, schema=schema)
+    validator(event_body)
 
     user_id = get_user_id(headers)
     if not user_id:
         return http_response(401, {"status": "error", "message": "Unauthorized"})
 
-    territories_data = event_body.get("territories", [])
-    territories = [Territory.from_dict(t, user_id=user_id) for t in territories_data]
+    territories = [
+        Territory.from_dict(t, user_id=user_id)
+        for t in event_body.get("territories", [])
+    ]
+
+    # Seed the user's counter before writing, the index count must not see
+    # this request's squares or the ADD below would count them twice
+    get_territory_counter(
+        dynamodb_client, TERRITORIES_TABLE, user_id, get_user_territory_count
+    )
 
-    # Upsert each territory
-    for t in territories:
-        upsert_territory_dynamodb(t)
+    # One timestamp shared by every territory in this request
+    now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    # Upsert all territories, each behind its own pace condition
+    deltas = upsert_territories(territories, now_iso)
+
+    # Keep the owners' counters in step with the squares that changed hands
+    add_territory_counts(dynamodb_client, TERRITORIES_TABLE, deltas)
 
-    # Count user territories (active)
-    territory_count = get_user_territory_count(user_id)
+    # Count user territories (active), the counter exists at this point
+    counter = get_territory_counter(
+        dynamodb_client, TERRITORIES_TABLE, user_id, get_user_territory_count
+    )
+    territory_count = int(counter["territory_count"]["N"])
 
     logger.info(
         f"User {user_id} has {territory_count} active territories after upsert."
@@ -81,112 +126,144 @@ def lambda_handler(event, context):
     )
 
 
-def upsert_territory_dynamodb(t: Territory):
-    """Upsert a territory into DynamoDB."""
-
-    square_key = make_square_key(t)
-    now_iso = datetime.datetime.now().isoformat()
-
-    item_attrs = {
-        "average_pace": (
-            Decimal(str(t.average_pace)) if t.average_pace is not None else Decimal("0")
-        ),
-        "user_id": t.user_id,
-        "color": t.color,
-        "left_top_corner_lat": (
-            Decimal(str(t.left_top_corner_lat))
-            if t.left_top_corner_lat is not None
-            else Decimal("0")
-        ),
-        "left_top_corner_lng": (
-            Decimal(str(t.left_top_corner_lng))
-            if t.left_top_corner_lng is not None
-            else Decimal("0")
-        ),
-        "right_top_corner_lat": (
-            Decimal(str(t.right_top_corner_lat))
-            if t.right_top_corner_lat is not None
-            else Decimal("0")
-        ),
-        "right_top_corner_lng": (
-            Decimal(str(t.right_top_corner_lng))
-            if t.right_top_corner_lng is not None
-            else Decimal("0")
-        ),
-        "left_bottom_corner_lat": (
-            Decimal(str(t.left_bottom_corner_lat))
-            if t.left_bottom_corner_lat is not None
-            else Decimal("0")
-        ),
-        "left_bottom_corner_lng": (
-            Decimal(str(t.left_bottom_corner_lng))
-            if t.left_bottom_corner_lng is not None
-            else Decimal("0")
-        ),
-        "right_bottom_corner_lat": (
-            Decimal(str(t.right_bottom_corner_lat))
-            if t.right_bottom_corner_lat is not None
-            else Decimal("0")
-        ),
-        "right_bottom_corner_lng": (
-            Decimal(str(t.right_bottom_corner_lng))
-            if t.right_bottom_corner_lng is not None
-            else Decimal("0")
-        ),
-        "updated_at": now_iso,
-    }
+def upsert_territories(territories: list[Territory], now_iso: str) -> Counter:
+    """
+    Upsert territories with one conditional UpdateItem each, keeping an existing
+    territory only when it was run at a better (lower) average pace.
+    Returns the change in active territory count per user, counted only from
+    the updates DynamoDB applied.
+    """
+
+    # Keep the fastest entry per square, one update per square is enough
+    candidates = {}
+    for t in territories:
+        square_key = make_square_key(t)
+        item = build_territory_item(t, now_iso)
+        current = candidates.get(square_key)
+        if current is None or item_pace(current) > item_pace(item):
+            candidates[square_key] = item
+
+    results = executor.map(
+        lambda candidate: upsert_territory(*candidate), candidates.items()
+    )
+
+    deltas = Counter()
+    upserted = 0
+    for item, (written, old) in zip(candidates.values(), results):
+        if not written:
+            continue
+        upserted += 1
+
+        # Updates keep deleted_at, a soft deleted square stays out of the counts
+        if not is_active(old):
+            continue
+
+        # The square moves from the previous owner's count to the new one's
+        if old:
+            deltas[old["user_id"]["S"]] -= 1
+        deltas[item["user_id"]["S"]] += 1
+
+    logger.debug(f"Upserted {upserted} of {len(candidates)} territories")
+
+    return deltas
 
-    update_expr = "SET " + ", ".join(f"{k}=:{k}" for k in item_attrs.keys())
-    expr_attr_vals = {f":{k}": v for k, v in item_attrs.items()}
+
+def upsert_territory(square_key: str, item: dict) -> tuple[bool, dict]:
+    """
+    Update one territory if the new run beats the stored pace. Returns whether
+    the update was applied and the attributes stored before it (empty for a
+    new square).
+    """
+
+    update_expr = "SET " + ", ".join(f"{k} = :{k}" for k in item)
 
     # Add created_at only if it does not exist
-    update_expr += ", created_at = if_not_exists(created_at, :created_at)"
-    expr_attr_vals[":created_at"] = now_iso
+    update_expr += ", created_at = if_not_exists(created_at, :updated_at)"
 
     try:
-        territories_table.update_item(
-            Key={"square_key": square_key},
+        response = dynamodb_client.update_item(
+            TableName=TERRITORIES_TABLE,
+            Key={"square_key": {"S": square_key}},
             UpdateExpression=update_expr,
-            ExpressionAttributeValues=expr_attr_vals,
-            ConditionExpression=Attr("average_pace").gt(item_attrs["average_pace"])
-            | Attr("square_key").not_exists(),
+            ConditionExpression=UPSERT_CONDITION,
+            ExpressionAttributeValues={f":{k}": v for k, v in item.items()},
+            ReturnValues="ALL_OLD",
         )
-
-        logger.debug(f"Upserted territory for user {t.user_id} ({square_key})")
-    except botocore.exceptions.ClientError as e:
-        # If the conditional fails, it's a valid "no-op": someone with better/equal
-        # pace already owns it. Swallow it and just log at info/debug.
+    except ClientError as e:
+        # Someone with better/equal pace already owns it, valid no-op
         if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
             logger.info(
-                "Territory upsert skipped due to conditional check",
-                extra={"square_key": square_key, "user_id": t.user_id},
+                "Territory upsert skipped, existing pace is better or equal",
+                extra={"square_key": square_key, "user_id": item["user_id"]["S"]},
             )
-            return
+            return False, {}
 
-        # For any other ClientError, re-raise to be handled by middleware
+        # Any other ClientError is handled by middleware
         raise
 
+    return True, response.get("Attributes", {})
+
+
+def build_territory_item(t: Territory, now_iso: str) -> dict:
+    """
+    Build the DynamoDB attributes for a territory, already in the low-level
+    attribute value format so no per-call type serialization is needed.
+    """
+
+    center_lat = (t.left_top_corner_lat + t.right_bottom_corner_lat) / 2
+    center_lng = (t.left_top_corner_lng + t.right_bottom_corner_lng) / 2
+
+    item = {
+        field: {"N": str(value)} if (value := getattr(t, field)) is not None else ZERO
+        for field in DECIMAL_FIELDS
+    }
+
+    return {
+        **item,
+        "user_id": {"S": t.user_id},
+        "color": {"S": t.color} if t.color is not None else {"NULL": True},
+        # Center and its cell, listing filters and partitions on these
+        "center_lat": {"N": str(center_lat)},
+        "center_lng": {"N": str(center_lng)},
+        "geohash": {"S": geohash_encode(center_lat, center_lng)},
+        "updated_at": {"S": now_iso},
+    }
+
+
+def is_active(item: dict) -> bool:
+    """Whether a low-level DynamoDB territory item is not soft deleted."""
+
+    return "NULL" in item.get("deleted_at", {"NULL": True})
+
+
+def item_pace(item: dict) -> Decimal:
+    """Average pace of a low-level DynamoDB territory item."""
+
+    return Decimal(item["average_pace"]["N"])
+
 
 def get_user_territory_count(user_id: str) -> int:
-    """Count territories for a user (deleted_at == None)."""
+    """
+    Count territories for a user (deleted_at == None) on the index, only used
+    to seed the user's counter item.
+    """
+
+    # Only counts come back, no item bytes
+    query_kwargs = {
+        "IndexName": "user_id-index",
+        "KeyConditionExpression": Key("user_id").eq(user_id),
+        "FilterExpression": Attr("deleted_at").not_exists()
+        | Attr("deleted_at").eq(None),
+        "Select": "COUNT",
+    }
 
-    response = territories_table.query(
-        IndexName="user_id-index",
-        KeyConditionExpression=Key("user_id").eq(user_id),
-        FilterExpression=Attr("deleted_at").not_exists() | Attr("deleted_at").eq(None),
-        ProjectionExpression="user_id",
-    )
+    response = territories_table.query(**query_kwargs)
     count = response["Count"]
 
     # Handle pagination
     while "LastEvaluatedKey" in response:
         response = territories_table.query(
-            IndexName="user_id-index",
-            KeyConditionExpression=Key("user_id").eq(user_id),
-            FilterExpression=Attr("deleted_at").not_exists()
-            | Attr("deleted_at").eq(None),
-            ProjectionExpression="user_id",
-            ExclusiveStartKey=response["LastEvaluatedKey"],
+            ExclusiveStartKey=response["LastEvaluatedKey"], **query_kwargs
         )
         count += response["Count"]
 
@@ -222,4 +299,5 @@ def make_square_key(t: Territory) -> str:
     ]
     s = "|".join(str(c) for c in coords)
 
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+    # Identifier, not a security boundary, skip the FIPS checks
+    return hashlib.sha256(s.encode("utf-8"), usedforsecurity=False).hexdigest()
@@ -3,6 +3,8 @@ schema = {
     "properties": {
         "territories": {
             "type": "array",
+            # One conditional write per square, bounds the work per request
+            "maxItems": 1000,
             "items": {
                 "type": "object",
                 "properties": {
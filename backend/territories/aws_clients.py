@@ -0,0 +1,48 @@
+"""
+Shared AWS clients for the territories Lambda functions.
+Created once per execution environment and reused across invocations.
+"""
+
+import os
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Environment variables
+AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
+
+# Single session so service models are loaded only once
+SESSION = boto3.session.Session(region_name=AWS_REGION)
+
+# Keep pooled HTTPS connections alive between warm invocations
+CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=20,
+    retries={"max_attempts": 3, "mode": "standard"},
+)
+
+# DynamoDB resource
+dynamodb = SESSION.resource("dynamodb", config=CLIENT_CONFIG)
+
+# Low-level DynamoDB client for hot paths that pass attribute values directly
+dynamodb_client = SESSION.client("dynamodb", config=CLIENT_CONFIG)
+
+# Cognito client
+cognito_client = SESSION.client("cognito-idp", config=CLIENT_CONFIG)
+
+
+def warm_connection(table_name):
+    """
+    Open a DynamoDB connection during init so the first request skips the DNS
+    lookup and TLS handshake. Only useful where init runs ahead of traffic
+    (provisioned concurrency), not for SnapStart where sockets don't survive
+    the snapshot.
+    """
+
+    # The resource and the low-level client keep separate connection pools
+    for client in (dynamodb.meta.client, dynamodb_client):
+        try:
+            client.describe_table(TableName=table_name)
+        except (BotoCoreError, ClientError):
+            # Best effort, the first request opens the connection instead
+            pass
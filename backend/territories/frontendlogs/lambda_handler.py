@@ -3,23 +3,28 @@ Lambda function to log frontend actions to DynamoDB.
 """
 
 import os
+import time
 import uuid
-import json
-import boto3
+import orjson
 from aws_lambda_powertools import Logger
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response
+from aws_clients import dynamodb
+from middleware import (
+    middleware,
+    http_response,
+)
 
 # Configure logging
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION")
 LOGS_TABLE_NAME = os.environ.get("FRONTEND_LOGS_TABLE")
 
-# Clients
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
+# Log rows are removed by the table TTL after this many seconds
+LOG_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# DynamoDB client
 frontend_logs_table = dynamodb.Table(LOGS_TABLE_NAME)
 
 
@@ -32,13 +37,9 @@ def lambda_handler(event, context):
     request_id = context.aws_request_id
     logger.append_keys(request_id=request_id)
 
-    # Handle preflight OPTIONS request
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
-
     # Retrieve body info
-    event_body = json.loads(event.get("body") or "{}")
+    raw_body = event.get("body")
+    event_body = orjson.loads(raw_body) if raw_body else {}
     logs_value = event_body.get("log")
 
     # Log the incoming request body
@@ -47,6 +48,7 @@ def lambda_handler(event, context):
     log_item = {
         "id": log_id,
         "log": logs_value,
+        "expires_at": int(time.time()) + LOG_RETENTION_SECONDS,
     }
     frontend_logs_table.put_item(Item=log_item)
 
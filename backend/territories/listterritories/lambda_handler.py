@@ -5,24 +5,65 @@ Lambda function to list territories within a lat/lng bounding box.
 from decimal import Decimal
 import os
 import math
-import boto3
+import orjson
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import TypeDeserializer
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_id
+from aws_clients import dynamodb_client, warm_connection
+from middleware import (
+    middleware,
+    http_response,
+    load_validator,
+    get_user_id,
+    geohash_cells,
+    split_lng_range,
+    MAX_GEOHASH_CELLS,
+)
 from validation_schema import schema
 
 logger = Logger()
 
 # Environment Variables
-AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
 TERRITORIES_TABLE = os.environ.get("TERRITORIES_TABLE")
+GEOHASH_BACKFILLED = os.environ.get("GEOHASH_BACKFILLED") == "true"
 
-# DynamoDB client
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-territories_table = dynamodb.Table(TERRITORIES_TABLE)
+# Geohash cells are queried side by side, up to eight at a time
+executor = ThreadPoolExecutor(max_workers=8)
+
+# Territories are 100 m squares, a center up to half a diagonal outside the box
+# can still have a corner inside it
+TERRITORY_HALF_DIAGONAL_KM = 0.1 * math.sqrt(2) / 2
+
+# cos(latitude) per 0.1 degree, finer steps don't change a 5 km box noticeably
+COS_LAT_TABLE = tuple(math.cos(math.radians(i / 10)) for i in range(-900, 901))
+
+# Floor for cos(latitude), near the poles the table rounds to cos(90) ~ 0 and
+# the box width would blow up
+MIN_COS_LAT = 1e-3
+
+# Key condition and filter are fixed, only the values change per request
+GEOHASH_KEY_CONDITION = "geohash = :geohash"
+CENTER_FILTER_EXPRESSION = (
+    "attribute_not_exists(deleted_at) "
+    "AND center_lat BETWEEN :min_lat AND :max_lat "
+    "AND center_lng BETWEEN :min_lng AND :max_lng"
+)
+MISSING_GEOHASH_FILTER_EXPRESSION = (
+    "attribute_not_exists(geohash) AND attribute_not_exists(deleted_at)"
+)
+
+# Cells are read on worker threads through the low-level client, boto3
+# resources are not thread-safe. Items are converted back to Python values
+deserializer = TypeDeserializer()
+
+# Provisioned environments open the connection before the first request
+warm_connection(TERRITORIES_TABLE)
+
+# Validator generated at bundling time
+validator = load_validator(schema)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -33,24 +74,19 @@ def lambda_handler(event, context):
     request_id = context.aws_request_id
     logger.append_keys(request_id=request_id)
 
-    # Handle CORS
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
-
     # Query params & headers
     query_params = event.get("queryStringParameters") or {}
     headers = event.get("headers") or {}
 
     # Validate request
     logger.info("Validating request")
-    validate(event=query_params, schema=schema)
+    validator(query_params)
 
     user_id = get_user_id(headers)
     if not user_id:
         return http_response(401, {"status": "error", "message": "Unauthorized"})
 
-    # Parse lat/lng
+    # Parse lat/lng, float() is the only format check, NaN fails the ranges
     try:
         lat = float(query_params.get("lat"))
         lng = float(query_params.get("lng"))
@@ -59,10 +95,15 @@ def lambda_handler(event, context):
             400, {"status": "error", "message": "Invalid lat/lng values"}
         )
 
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return http_response(
+            400, {"status": "error", "message": "Invalid lat/lng values"}
+        )
+
     # Bounding box: ±5 km (~10 km total radius)
     radius_km = 5.0
     lat_deg_delta = radius_km / 111.32
-    lng_deg_delta = radius_km / (111.32 * math.cos(math.radians(lat)))
+    lng_deg_delta = radius_km / (111.32 * cos_lat(lat))
 
     min_lat = lat - lat_deg_delta
     max_lat = lat + lat_deg_delta
@@ -73,8 +114,18 @@ def lambda_handler(event, context):
         f"Searching territories in bounding box lat[{min_lat}, {max_lat}] lng[{min_lng}, {max_lng}]"
     )
 
-    territories_data = fetch_territories_within_bounds(
-        min_lat, max_lat, min_lng, max_lng
+    try:
+        territories = fetch_territories_within_bounds(
+            min_lat, max_lat, min_lng, max_lng
+        )
+    except ValueError:
+        return http_response(
+            400, {"status": "error", "message": "Bounding box covers too many cells"}
+        )
+
+    # Serialize territories as they are matched instead of collecting them first
+    territories_json = b",".join(
+        orjson.dumps(territory, default=str) for territory in territories
     )
 
     return http_response(
@@ -82,55 +133,158 @@ def lambda_handler(event, context):
         {
             "status": "success",
             "message": "Territories returned successfully.",
-            "territories": territories_data,
+            "territories": orjson.Fragment(b"[" + territories_json + b"]"),
         },
     )
 
 
-# TODO: this needs to be optimized for large datasets (use geohashing or similar)
 def fetch_territories_within_bounds(min_lat, max_lat, min_lng, max_lng):
     """
-    Scan DynamoDB for territories whose any corner is within the bounding box.
-    Note: This performs a filtered scan — acceptable for small/moderate datasets.
+    Query geohash-index for every cell covering the bounding box, filter on the
+    stored territory center and return a generator of the territories with any
+    corner inside it. Boxes crossing the antimeridian are split in two.
+    Until GEOHASH_BACKFILLED is set, territories without a geohash are scanned.
+    Raises ValueError when the box needs more than MAX_GEOHASH_CELLS cells.
     """
 
-    min_lat = Decimal(str(min_lat))
-    max_lat = Decimal(str(max_lat))
-    min_lng = Decimal(str(min_lng))
-    max_lng = Decimal(str(max_lng))
+    lat_margin = TERRITORY_HALF_DIAGONAL_KM / 111.32
+    lng_margin = TERRITORY_HALF_DIAGONAL_KM / (
+        111.32 * cos_lat((min_lat + max_lat) / 2)
+    )
+    min_center_lat = max(min_lat - lat_margin, -90.0)
+    max_center_lat = min(max_lat + lat_margin, 90.0)
 
-    filter_expr = Attr("deleted_at").not_exists() & (
-        (
-            Attr("left_top_corner_lat").between(min_lat, max_lat)
-            & Attr("left_top_corner_lng").between(min_lng, max_lng)
+    queries = []
+    for min_center_lng, max_center_lng in split_lng_range(
+        min_lng - lng_margin, max_lng + lng_margin
+    ):
+        filter_values = {
+            ":min_lat": {"N": str(Decimal(str(min_center_lat)))},
+            ":max_lat": {"N": str(Decimal(str(max_center_lat)))},
+            ":min_lng": {"N": str(Decimal(str(min_center_lng)))},
+            ":max_lng": {"N": str(Decimal(str(max_center_lng)))},
+        }
+        cells = geohash_cells(
+            min_center_lat, max_center_lat, min_center_lng, max_center_lng
         )
-        | (
-            Attr("right_top_corner_lat").between(min_lat, max_lat)
-            & Attr("right_top_corner_lng").between(min_lng, max_lng)
-        )
-        | (
-            Attr("left_bottom_corner_lat").between(min_lat, max_lat)
-            & Attr("left_bottom_corner_lng").between(min_lng, max_lng)
-        )
-        | (
-            Attr("right_bottom_corner_lat").between(min_lat, max_lat)
-            & Attr("right_bottom_corner_lng").between(min_lng, max_lng)
+        queries.extend((cell, filter_values) for cell in cells)
+
+    if len(queries) > MAX_GEOHASH_CELLS:
+        raise ValueError(f"Bounding box needs {len(queries)} cells")
+
+    logger.info(f"Querying {len(queries)} geohash cells")
+
+    lat_range = (Decimal(str(min_lat)), Decimal(str(max_lat)))
+    lng_ranges = [
+        (Decimal(str(low)), Decimal(str(high)))
+        for low, high in split_lng_range(min_lng, max_lng)
+    ]
+
+    # Territories stored before geohash-index stay out of it until the backfill
+    # has run, scan for them next to the cell queries
+    missing_geohash = None
+    if not GEOHASH_BACKFILLED:
+        missing_geohash = executor.submit(scan_territories_without_geohash)
+
+    cell_items = executor.map(lambda query: query_geohash_cell(*query), queries)
+    if missing_geohash is not None:
+        cell_items = chain(cell_items, [missing_geohash.result()])
+
+    return matching_territories(cell_items, lat_range, lng_ranges)
+
+
+def matching_territories(cell_items, lat_range, lng_ranges):
+    """Yield the queried territories with any corner inside the bounding box."""
+
+    found = 0
+    for items in cell_items:
+        for territory in items:
+            if territory_in_bounds(territory, lat_range, lng_ranges):
+                found += 1
+                yield territory
+
+    logger.info(f"Found {found} matching territories")
+
+
+def query_geohash_cell(cell, filter_values):
+    """Fetch all territories stored in one geohash cell whose center is in range."""
+
+    query_kwargs = {
+        "TableName": TERRITORIES_TABLE,
+        "IndexName": "geohash-index",
+        "KeyConditionExpression": GEOHASH_KEY_CONDITION,
+        "FilterExpression": CENTER_FILTER_EXPRESSION,
+        "ExpressionAttributeValues": {":geohash": {"S": cell}, **filter_values},
+    }
+
+    items = []
+    response = dynamodb_client.query(**query_kwargs)
+    items.extend(map(deserialize_item, response.get("Items", [])))
+
+    # Handle pagination
+    while "LastEvaluatedKey" in response:
+        response = dynamodb_client.query(
+            ExclusiveStartKey=response["LastEvaluatedKey"], **query_kwargs
         )
-    )
+        items.extend(map(deserialize_item, response.get("Items", [])))
+
+    return items
+
+
+def scan_territories_without_geohash():
+    """
+    Fetch all territories that have no geohash yet, the corner check in
+    matching_territories keeps the ones inside the bounding box.
+    """
+
+    scan_kwargs = {
+        "TableName": TERRITORIES_TABLE,
+        "FilterExpression": MISSING_GEOHASH_FILTER_EXPRESSION,
+    }
 
-    scan_kwargs = {"FilterExpression": filter_expr}
-    results = []
-    response = territories_table.scan(**scan_kwargs)
-    results.extend(response.get("Items", []))
+    items = []
+    response = dynamodb_client.scan(**scan_kwargs)
+    items.extend(map(deserialize_item, response.get("Items", [])))
 
     # Handle pagination
     while "LastEvaluatedKey" in response:
-        response = territories_table.scan(
+        response = dynamodb_client.scan(
             ExclusiveStartKey=response["LastEvaluatedKey"], **scan_kwargs
         )
+        items.extend(map(deserialize_item, response.get("Items", [])))
+
+    return items
+
+
+def deserialize_item(item):
+    """Convert a low-level DynamoDB item to Python values (numbers as Decimal)."""
+
+    return {key: deserializer.deserialize(value) for key, value in item.items()}
+
 
-        results.extend(response.get("Items", []))
+def territory_in_bounds(territory, lat_range, lng_ranges):
+    """Check whether any corner of the territory falls inside the bounding box."""
 
-    logger.info(f"Found {len(results)} matching territories")
+    min_lat, max_lat = lat_range
+
+    for corner in ("left_top", "right_top", "left_bottom", "right_bottom"):
+        corner_lat = territory.get(f"{corner}_corner_lat")
+        corner_lng = territory.get(f"{corner}_corner_lng")
+        if corner_lat is None or corner_lng is None:
+            continue
+
+        if min_lat <= corner_lat <= max_lat and any(
+            min_lng <= corner_lng <= max_lng for min_lng, max_lng in lng_ranges
+        ):
+            return True
+
+    return False
+
+
+def cos_lat(lat):
+    """
+    Cosine of a latitude in degrees, read from the 0.1 degree table and never
+    below MIN_COS_LAT.
+    """
 
-    return results
+    return max(COS_LAT_TABLE[round(lat * 10) + 900], MIN_COS_LAT)
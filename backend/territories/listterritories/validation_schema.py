@@ -3,11 +3,9 @@ schema = {
     "properties": {
         "lat": {
             "type": "string",
-            "pattern": r"^-?\d+\.\d+$",
         },
         "lng": {
             "type": "string",
-            "pattern": r"^-?\d+\.\d+$",
         },
     },
     "required": [
@@ -4,21 +4,52 @@ Handles error catching, logging, and CORS responses.
 """
 
 import os
-import json
+import time
+import hashlib
+import importlib
+import orjson
+import jwt
+import fastjsonschema
+from cachetools import TLRUCache
+from fastjsonschema import JsonSchemaException
 from aws_lambda_powertools.middleware_factory import lambda_handler_decorator
 from aws_lambda_powertools.utilities.validation import SchemaValidationError
 from aws_lambda_powertools import Logger
 from botocore.exceptions import ClientError
-import boto3
+
+# pylint: disable=import-error
+from aws_clients import AWS_REGION, cognito_client
 
 # Configure logging
 logger = Logger()
 
-# Clients
-cognito_client = boto3.client("cognito-idp")
+# Cache of access token hash -> (user id, token exp), an entry lives for
+# 5 minutes at most and never past the expiry of its token
+USER_ID_CACHE = TLRUCache(
+    maxsize=1024,
+    ttu=lambda _key, value, now: min(now + 300, value[1]),
+    timer=time.time,
+)
 
 # Environment variables
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
+USER_POOL_ID = os.environ.get("USER_POOL_ID")
+
+# Access tokens are verified locally against the user pool signing keys
+COGNITO_ISSUER = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{USER_POOL_ID}"
+jwks_client = jwt.PyJWKClient(
+    f"{COGNITO_ISSUER}/.well-known/jwks.json", lifespan=3600, timeout=5
+)
+
+# Per-user territory counters live in the territories table under this key prefix
+TERRITORY_COUNTER_PREFIX = "COUNTER#"
+
+# Geohash length used to partition territories, cells are ~4.9 km x 4.9 km
+GEOHASH_PRECISION = 5
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Upper bound on cells per listing, each cell costs one Query
+MAX_GEOHASH_CELLS = 64
 
 # Default headers
 BASE_HEADERS = {
@@ -47,13 +78,19 @@ def middleware(handler, event, context):
     except ClientError as e:
         return _handle_client_error(e, context)
 
-    except SchemaValidationError as e:
+    except (SchemaValidationError, JsonSchemaException) as e:
         logger.warning(
             "schema validation failed",
             extra={"status": "error", "reason": "schema_failed"},
         )
         return http_response(400, {"status": "error", "message": str(e)})
 
+    except jwt.PyJWTError as e:
+        logger.warning("Access token rejected", extra={"error": str(e)})
+        return http_response(
+            401, {"status": "error", "message": "Access token expired"}
+        )
+
     # pylint: disable=broad-except
     except Exception as e:
         logger.error("Unexpected error during request", extra={"error": str(e)})
@@ -124,12 +161,13 @@ def _handle_client_error(e, context):
 def http_response(status, body, extra_headers=None, multi_value_headers=None):
     """Construct HTTP response with standard headers."""
 
-    headers = {**BASE_HEADERS, **(extra_headers or {})}
+    # Share BASE_HEADERS when nothing is added, API Gateway never mutates it
+    headers = {**BASE_HEADERS, **extra_headers} if extra_headers else BASE_HEADERS
 
     resp = {
         "statusCode": status,
         "headers": headers,
-        "body": json.dumps(body, default=str),
+        "body": orjson.dumps(body, default=str).decode(),
     }
 
     if multi_value_headers:
@@ -138,22 +176,16 @@ def http_response(status, body, extra_headers=None, multi_value_headers=None):
     return resp
 
 
-def cors_response(method):
-    """Handle CORS preflight requests."""
-
-    if method == "OPTIONS":
-        return http_response(
-            200,
-            "",
-            extra_headers={
-                "Access-Control-Allow-Headers": (
-                    "Content-Type,Authorization,Access_token,access_token"
-                ),
-                "Access-Control-Allow-Methods": ("OPTIONS,GET,POST,PUT,DELETE,PATCH"),
-            },
-        )
+def load_validator(schema: dict, module: str = "compiled_validator"):
+    """
+    Return the validator generated by build_validators.py at bundling time,
+    falling back to compiling the schema when running from source.
+    """
 
-    return None
+    try:
+        return importlib.import_module(module).validate
+    except ImportError:
+        return fastjsonschema.compile(schema)
 
 
 def get_user_attributes(headers: dict) -> dict:
@@ -189,19 +221,211 @@ def get_user_attributes(headers: dict) -> dict:
     return user_attributes
 
 
+def decode_access_token(access_token: str) -> dict:
+    """
+    Verify a Cognito access token locally and return its claims.
+    Raises a jwt.PyJWTError when the token is invalid or expired.
+    """
+
+    signing_key = jwks_client.get_signing_key_from_jwt(access_token)
+    claims = jwt.decode(
+        access_token,
+        signing_key.key,
+        algorithms=["RS256"],
+        issuer=COGNITO_ISSUER,
+        options={"require": ["exp", "iss", "sub"]},
+    )
+
+    # ID tokens are signed with the same keys, only accept access tokens
+    if claims.get("token_use") != "access":
+        raise jwt.InvalidTokenError("Not an access token")
+
+    return claims
+
+
 def get_user_id(headers):
     """
-    Extract user ID from Cognito using access token in headers.
+    Extract user ID from the access token in headers.
     """
 
-    user_attributes = get_user_attributes(headers)
+    access_token = headers.get("access_token") or headers.get("Access_token")
+
+    if not access_token:
+        logger.warning(
+            "Access token missing",
+            extra={"headers": headers},
+        )
+        return None
 
-    # Extract user id
-    user_id = user_attributes.get("sub")
+    # Reuse the user id resolved by an earlier invocation of this container
+    cache_key = hashlib.blake2b(access_token.encode(), digest_size=16).hexdigest()
+    cached = USER_ID_CACHE.get(cache_key)
+    if cached:
+        return cached[0]
+
+    try:
+        claims = decode_access_token(access_token)
+    except jwt.PyJWKClientConnectionError:
+        # Signing keys unreachable, let Cognito validate the token instead.
+        # Not cached, the expiry of the token is unknown on this path
+        logger.warning("JWKS fetch failed, falling back to Cognito GetUser")
+        return get_user_attributes(headers).get("sub")
+
+    user_id = claims.get("sub")
+    if user_id:
+        USER_ID_CACHE[cache_key] = (user_id, claims["exp"])
 
     return user_id
 
 
+def territory_counter_key(user_id: str) -> dict:
+    """Low-level key of the item holding a user's active territory count."""
+
+    return {"square_key": {"S": f"{TERRITORY_COUNTER_PREFIX}{user_id}"}}
+
+
+def add_territory_counts(client, table_name, deltas: dict):
+    """
+    Apply per-user territory count changes to the counter items.
+    Counters that were never seeded are left alone, get_territory_counter seeds
+    them from the index on the next read.
+    """
+
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+
+        try:
+            client.update_item(
+                TableName=table_name,
+                Key=territory_counter_key(user_id),
+                UpdateExpression="ADD territory_count :delta",
+                ConditionExpression="attribute_exists(square_key)",
+                ExpressionAttributeValues={":delta": {"N": str(delta)}},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+
+def get_territory_counter(client, table_name, user_id: str, count_from_index) -> dict:
+    """
+    Read a user's counter item in the low-level attribute value format. A
+    missing counter is seeded once with count_from_index(user_id) as its
+    territory_count.
+    """
+
+    key = territory_counter_key(user_id)
+
+    response = client.get_item(TableName=table_name, Key=key, ConsistentRead=True)
+    if "Item" in response:
+        return response["Item"]
+
+    item = {**key, "territory_count": {"N": str(count_from_index(user_id))}}
+
+    try:
+        client.put_item(
+            TableName=table_name,
+            Item=item,
+            ConditionExpression="attribute_not_exists(square_key)",
+        )
+    except ClientError as e:
+        # Seeded concurrently by another invocation, the counts match
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+    return item
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a coordinate as a geohash of the given length."""
+
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    is_lng = True
+
+    # Bits alternate between longitude and latitude, five bits per character
+    while len(chars) < precision:
+        value_range, value = (lng_range, lng) if is_lng else (lat_range, lat)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+
+        is_lng = not is_lng
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def split_lng_range(min_lng: float, max_lng: float) -> list:
+    """
+    Split a longitude range that crosses the antimeridian into ranges that
+    stay within [-180, 180].
+    """
+
+    if max_lng - min_lng >= 360:
+        return [(-180.0, 180.0)]
+
+    if min_lng < -180:
+        return [(min_lng + 360, 180.0), (-180.0, max_lng)]
+
+    if max_lng > 180:
+        return [(min_lng, 180.0), (-180.0, max_lng - 360)]
+
+    return [(min_lng, max_lng)]
+
+
+def geohash_cells(
+    min_lat: float,
+    max_lat: float,
+    min_lng: float,
+    max_lng: float,
+    precision: int = GEOHASH_PRECISION,
+    max_cells: int = MAX_GEOHASH_CELLS,
+) -> set:
+    """
+    Return the geohash cells that cover a lat/lng bounding box, clamped to valid
+    coordinates. Raises ValueError when more than max_cells cells are needed.
+    """
+
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0)
+
+    lat_step = 180.0 / 2 ** (5 * precision // 2)
+    lng_step = 360.0 / 2 ** ((5 * precision + 1) // 2)
+
+    # Sample the box at most one cell apart so no covered cell is skipped
+    cells = set()
+    lat = min_lat
+    while True:
+        lng = min_lng
+        while True:
+            cells.add(geohash_encode(min(lat, max_lat), min(lng, max_lng), precision))
+            if len(cells) > max_cells:
+                raise ValueError(f"Bounding box needs more than {max_cells} cells")
+
+            if lng >= max_lng:
+                break
+            lng += lng_step
+
+        if lat >= max_lat:
+            break
+        lat += lat_step
+
+    return cells
+
+
 class Territory:
     """Territory data model."""
 
@@ -3,26 +3,41 @@ Lambda function to mine coins for user territories.
 """
 
 from datetime import datetime, timezone
+from decimal import ROUND_DOWN, Decimal
 import os
-import boto3
 from boto3.dynamodb.conditions import Attr, Key
 from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response, get_user_attributes
+from aws_clients import dynamodb, dynamodb_client, cognito_client, warm_connection
+from middleware import (
+    middleware,
+    http_response,
+    get_user_attributes,
+    get_territory_counter,
+    territory_counter_key,
+)
 
 logger = Logger()
 
 # Environment
-AWS_REGION = os.environ.get("AWS_REGION", "eu-central-1")
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 TERRITORIES_TABLE = os.environ.get("TERRITORIES_TABLE")
-XP_MULTIPLIER = float(os.environ.get("XP_MULTIPLIER", "10"))
+XP_MULTIPLIER = Decimal(os.environ.get("XP_MULTIPLIER", "10"))
 
-# Clients
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
+# Mining rate: 0.05 tokens per territory every hour, kept exact per second
+MINING_RATE_PER_TERRITORY_PER_SECOND = Decimal("0.05") / Decimal(3600)
+
+# Stored balances keep a fixed scale, the per-second rate has a 28 digit
+# expansion that would otherwise pile up in the numbers DynamoDB stores
+BALANCE_SCALE = Decimal("0.000001")
+
+# DynamoDB client
 territories_table = dynamodb.Table(TERRITORIES_TABLE)
-cognito_client = boto3.client("cognito-idp", region_name=AWS_REGION)
+
+# Provisioned environments open the connection before the first request
+warm_connection(TERRITORIES_TABLE)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -33,11 +48,6 @@ def lambda_handler(event, context):
     request_id = context.aws_request_id
     logger.append_keys(request_id=request_id)
 
-    # Handle CORS
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
-
     headers = event.get("headers") or {}
 
     user_attributes = get_user_attributes(headers)
@@ -48,25 +58,44 @@ def lambda_handler(event, context):
     if not user_id:
         return http_response(401, {"status": "error", "message": "Unauthorized"})
 
-    # Count user territories (active)
-    territory_count = get_user_territory_count(user_id)
-
-    # Last mined in seconds
-    last_mined = int(user_attributes.get("custom:last_mined", "0"))
+    # Territory count and mining state share the user's counter item
+    counter = get_territory_counter(
+        dynamodb_client, TERRITORIES_TABLE, user_id, get_user_territory_count
+    )
+    territory_count = int(counter["territory_count"]["N"])
+
+    # Last mined in seconds, users who never mined here start from Cognito
+    previous_mined = counter.get("last_mined")
+    last_mined = int(
+        previous_mined["N"]
+        if previous_mined
+        else user_attributes.get("custom:last_mined", "0")
+    )
     current_time = int(datetime.now(timezone.utc).timestamp())
     elapsed_seconds = current_time - last_mined
 
     tokens_mined = calculate_mined_tokens(territory_count, elapsed_seconds)
-    new_xp = float(tokens_mined) * XP_MULTIPLIER
+    new_xp = (tokens_mined * XP_MULTIPLIER).quantize(BALANCE_SCALE, ROUND_DOWN)
 
     logger.info(
         f"Calculated {tokens_mined} tokens mined for {territory_count} territories over {elapsed_seconds} seconds."
     )
 
-    # Update Cognito attributes
-    update_cognito_territories_info(
-        user_id, territory_count, tokens_mined, new_xp, current_time
-    )
+    try:
+        balances = store_mined_tokens(
+            user_id, user_attributes, previous_mined, tokens_mined, new_xp, current_time
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        # Another invocation mined since the counter was read
+        return http_response(
+            409, {"status": "error", "message": "Tokens were already mined"}
+        )
+
+    # Mirror the stored totals to Cognito
+    update_cognito_territories_info(user_id, territory_count, balances, current_time)
 
     logger.info(f"Updated Cognito count for user {user_id}: {territory_count}")
 
@@ -80,51 +109,94 @@ def lambda_handler(event, context):
 
 
 def get_user_territory_count(user_id: str) -> int:
-    """Count territories for a user (deleted_at == None)."""
-
-    response = territories_table.query(
-        IndexName="user_id-index",
-        KeyConditionExpression=Key("user_id").eq(user_id),
-        FilterExpression=Attr("deleted_at").not_exists() | Attr("deleted_at").eq(None),
-        ProjectionExpression="user_id",
-    )
+    """
+    Count territories for a user (deleted_at == None) on the index, only used
+    to seed the user's counter item.
+    """
+
+    # Only counts come back, no item bytes
+    query_kwargs = {
+        "IndexName": "user_id-index",
+        "KeyConditionExpression": Key("user_id").eq(user_id),
+        "FilterExpression": Attr("deleted_at").not_exists()
+        | Attr("deleted_at").eq(None),
+        "Select": "COUNT",
+    }
+
+    response = territories_table.query(**query_kwargs)
     count = response["Count"]
 
+    # Handle pagination
+    while "LastEvaluatedKey" in response:
+        response = territories_table.query(
+            ExclusiveStartKey=response["LastEvaluatedKey"], **query_kwargs
+        )
+        count += response["Count"]
+
     return count
 
 
-def update_cognito_territories_info(
+# pylint: disable=too-many-arguments
+def store_mined_tokens(
     user_id: str,
-    territory_count: int,
-    tokens_mined: int,
-    new_xp: float,
+    user_attributes: dict,
+    previous_mined: dict,
+    tokens_mined: Decimal,
+    new_xp: Decimal,
     current_time: int,
-):
-    """Update custom attributes in Cognito by appending mined values."""
-
-    # Fetch current user to get existing balances
-    user = cognito_client.admin_get_user(
-        UserPoolId=USER_POOL_ID,
-        Username=user_id,
+) -> dict:
+    """
+    Add the mined tokens and xp to the user's counter item in one atomic update.
+    The update only applies if last_mined is still the value the tokens were
+    calculated from, so concurrent mines can't both credit the same period.
+    Balances missing from the item are seeded from the Cognito attributes.
+    """
+
+    values = {
+        ":now": {"N": str(current_time)},
+        ":tokens": {"N": format(tokens_mined, "f")},
+        ":new_xp": {"N": format(new_xp, "f")},
+        ":balance": {"N": user_attributes.get("custom:token_balance", "0")},
+        ":xp": {"N": user_attributes.get("custom:xp", "0")},
+    }
+
+    if previous_mined:
+        condition = "last_mined = :last_mined"
+        values[":last_mined"] = previous_mined
+    else:
+        condition = "attribute_not_exists(last_mined)"
+
+    response = dynamodb_client.update_item(
+        TableName=TERRITORIES_TABLE,
+        Key=territory_counter_key(user_id),
+        UpdateExpression=(
+            "SET last_mined = :now, "
+            "token_balance = if_not_exists(token_balance, :balance) + :tokens, "
+            "xp = if_not_exists(xp, :xp) + :new_xp"
+        ),
+        ConditionExpression=condition,
+        ExpressionAttributeValues=values,
+        ReturnValues="UPDATED_NEW",
     )
 
-    # Build a dict of current attributes
-    attrs = {a["Name"]: a["Value"] for a in user.get("UserAttributes", [])}
+    return response["Attributes"]
 
-    current_token_balance = float(attrs.get("custom:token_balance", "0"))
-    current_xp = float(attrs.get("custom:xp", "0"))
 
-    # Append new values
-    updated_token_balance = current_token_balance + float(tokens_mined)
-    updated_xp = current_xp + float(new_xp)
+def update_cognito_territories_info(
+    user_id: str,
+    territory_count: int,
+    balances: dict,
+    current_time: int,
+):
+    """Write the territory count and the stored balances to Cognito."""
 
     cognito_client.admin_update_user_attributes(
         UserPoolId=USER_POOL_ID,
         Username=user_id,
         UserAttributes=[
             {"Name": "custom:territory_blocks", "Value": str(territory_count)},
-            {"Name": "custom:token_balance", "Value": str(updated_token_balance)},
-            {"Name": "custom:xp", "Value": str(updated_xp)},
+            {"Name": "custom:token_balance", "Value": balances["token_balance"]["N"]},
+            {"Name": "custom:xp", "Value": balances["xp"]["N"]},
             {
                 "Name": "custom:last_mined",
                 "Value": str(current_time),
@@ -133,15 +205,15 @@ def update_cognito_territories_info(
     )
 
 
-def calculate_mined_tokens(territory_count: int, elapsed_seconds: int) -> int:
-    """Calculate mined tokens based on territory count and elapsed time."""
-
-    # Example mining rate: 1 token per territory every hour
-    mining_rate_per_territory_per_hour = 0.05
-    hours_elapsed = elapsed_seconds / 3600
+def calculate_mined_tokens(territory_count: int, elapsed_seconds: int) -> Decimal:
+    """
+    Calculate mined tokens based on territory count and elapsed time, rounded
+    down to BALANCE_SCALE so a user is never credited more than was mined.
+    """
 
-    tokens_mined = str(
-        float(territory_count * mining_rate_per_territory_per_hour * hours_elapsed)
+    tokens = (
+        Decimal(territory_count)
+        * MINING_RATE_PER_TERRITORY_PER_SECOND
+        * Decimal(elapsed_seconds)
     )
-
-    return tokens_mined
+    return tokens.quantize(BALANCE_SCALE, ROUND_DOWN)
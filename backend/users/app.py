@@ -2,8 +2,10 @@
 AWS CDK Stack for Terrastride Users Service
 """
 
+import os
 from aws_cdk import (
     App,
+    DockerVolume,
     Stack,
     CfnOutput,
     Duration,
@@ -15,10 +17,20 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+# Host pip cache mounted into the bundling containers, wheels are reused across synths
+PIP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pip")
+
+# Shared build scripts (build_validators.py), mounted into the bundling containers
+BUILD_SCRIPTS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "scripts")
+)
+
 
 def lambda_bundling(directory: str):
     """Helper function for Lambda bundling configuration."""
 
+    os.makedirs(PIP_CACHE_DIR, exist_ok=True)
+
     return {
         "image": _lambda.Runtime.PYTHON_3_12.bundling_image,  # pylint: disable=no-member
         "command": [
@@ -26,11 +38,24 @@ def lambda_bundling(directory: str):
             "-c",
             (
                 f"cd {directory} && "
-                "pip install aws-lambda-powertools fastjsonschema -t /asset-output && "
-                "cp -r . /asset-output && "
-                "cp ../middleware.py /asset-output"
+                "pip install aws-lambda-powertools fastjsonschema orjson "
+                "--cache-dir /pip-cache -t /asset-output && "
+                # Copy the handler without tests, docs or local caches
+                "tar -c --exclude=tests --exclude='test_*' --exclude='*.md' "
+                "--exclude=.venv --exclude=__pycache__ --exclude='*.pyc' . "
+                "| tar -x -C /asset-output && "
+                "cp ../middleware.py ../aws_clients.py /asset-output && "
+                # Turn the request schemas into Python code once, at build time
+                "if [ -f validation_schema.py ]; then "
+                "PYTHONPATH=/asset-output "
+                "python /build-scripts/build_validators.py /asset-output; "
+                "fi"
             ),
         ],
+        "volumes": [
+            DockerVolume(host_path=PIP_CACHE_DIR, container_path="/pip-cache"),
+            DockerVolume(host_path=BUILD_SCRIPTS_DIR, container_path="/build-scripts"),
+        ],
     }
 
 
@@ -203,15 +228,21 @@ class TerrastrideUsersStack(Stack):
             ),
         )
 
-        # API Gateway Integrations
-        register_integration = apigw.LambdaIntegration(register_lambda)
-        login_integration = apigw.LambdaIntegration(login_lambda)
-        get_user_info_integration = apigw.LambdaIntegration(get_user_info_lambda)
+        # API Gateway Integrations, no extra permissions for console test invokes
+        register_integration = apigw.LambdaIntegration(
+            register_lambda, allow_test_invoke=False
+        )
+        login_integration = apigw.LambdaIntegration(
+            login_lambda, allow_test_invoke=False
+        )
+        get_user_info_integration = apigw.LambdaIntegration(
+            get_user_info_lambda, allow_test_invoke=False
+        )
         resend_verification_integration = apigw.LambdaIntegration(
-            resend_verification_lambda
+            resend_verification_lambda, allow_test_invoke=False
         )
         send_verification_integration = apigw.LambdaIntegration(
-            send_verification_lambda
+            send_verification_lambda, allow_test_invoke=False
         )
 
         # API Gateway Resources and Methods
@@ -3,11 +3,11 @@ Lambda function to get user information from AWS Cognito.
 """
 
 import os
-import boto3
 from aws_lambda_powertools import Logger
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response
+from aws_clients import cognito_client
+from middleware import middleware, http_response, CORS_PREFLIGHT_RESPONSE
 
 # Configure logging
 logger = Logger()
@@ -15,9 +15,6 @@ logger = Logger()
 # Environment Variables
 AWS_REGION = os.environ.get("AWS_REGION")
 
-# Clients
-cognito_client = boto3.client("cognito-idp")
-
 
 @logger.inject_lambda_context(log_event=True)
 @middleware
@@ -29,9 +26,8 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle preflight OPTIONS request
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     # Get request headers
     headers = event.get("headers") or {}
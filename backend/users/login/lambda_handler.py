@@ -2,14 +2,18 @@
 Lambda function to handle user login using AWS Cognito.
 """
 
-import json
+import orjson
 import os
-import boto3
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.validation import validate
 
 # pylint: disable=import-error
-from middleware import middleware, http_response, cors_response
+from aws_clients import cognito_client
+from middleware import (
+    middleware,
+    http_response,
+    CORS_PREFLIGHT_RESPONSE,
+    load_validator,
+)
 from validation_schema import schema
 
 # Configure logging
@@ -19,8 +23,8 @@ logger = Logger()
 USER_POOL_CLIENT_ID = os.environ["USER_POOL_CLIENT_ID"]
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-# Clients
-cognito_client = boto3.client("cognito-idp")
+# Validator generated at bundling time
+validator = load_validator(schema)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -33,16 +37,16 @@ def lambda_handler(event, context):
     logger.append_keys(request_id=request_id)
 
     # Handle preflight OPTIONS request
-    cors_resp = cors_response(event.get("httpMethod"))
-    if cors_resp:
-        return cors_resp
+    if event.get("httpMethod") == "OPTIONS":
+        return CORS_PREFLIGHT_RESPONSE
 
     # Get body request
-    event_body = json.loads(event.get("body")) if event.get("body") else {}
+    raw_body = event.get("body")
+    event_body = orjson.loads(raw_body) if raw_body else {}
 
     # Validate request
     logger.info("Validating request")
-    validate(event=event_body, schema=schema)
+    validator(event_body)
 
     # Extract request body
     email = event_body.get("email")
@@ -4,19 +4,21 @@ Handles error catching, logging, and CORS responses.
 """
 
 import os
-import json
+import importlib
+import orjson
+import fastjsonschema
+from fastjsonschema import JsonSchemaException
 from aws_lambda_powertools.middleware_factory import lambda_handler_decorator
 from aws_lambda_powertools.utilities.validation import SchemaValidationError
 from aws_lambda_powertools import Logger
 from botocore.exceptions import ClientError
-import boto3
+
+# pylint: disable=import-error
+from aws_clients import cognito_client
 
 # Configure logging
 logger = Logger()
 
-# Clients
-cognito_client = boto3.client("cognito-idp")
-
 # Environment variables
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
@@ -47,7 +49,7 @@ def middleware(handler, event, context):
     except ClientError as e:
         return _handle_client_error(e, context)
 
-    except SchemaValidationError as e:
+    except (SchemaValidationError, JsonSchemaException) as e:
         logger.warning(
             "schema validation failed",
             extra={"status": "error", "reason": "schema_failed"},
@@ -180,12 +182,13 @@ def _handle_client_error(e, context):
 def http_response(status, body, extra_headers=None, multi_value_headers=None):
     """Construct HTTP response with standard headers."""
 
-    headers = {**BASE_HEADERS, **(extra_headers or {})}
+    # Share BASE_HEADERS when nothing is added, API Gateway never mutates it
+    headers = {**BASE_HEADERS, **extra_headers} if extra_headers else BASE_HEADERS
 
     resp = {
         "statusCode": status,
         "headers": headers,
-        "body": json.dumps(body, default=str),
+        "body": orjson.dumps(body, default=str).decode(),
     }
 
     if multi_value_headers:
@@ -194,22 +197,29 @@ def http_response(status, body, extra_headers=None, multi_value_headers=None):
     return resp
 
 
-def cors_response(method):
-    """Handle CORS preflight requests."""
+# Prebuilt preflight response, it never changes between invocations
+CORS_PREFLIGHT_RESPONSE = http_response(
+    200,
+    "",
+    extra_headers={
+        "Access-Control-Allow-Headers": (
+            "Content-Type,Authorization,Access_token,access_token"
+        ),
+        "Access-Control-Allow-Methods": ("OPTIONS,GET,POST,PUT,DELETE,PATCH"),
+    },
+)
 
-    if method == "OPTIONS":
-        return http_response(
-            200,
-            "",
-            extra_headers={
-                "Access-Control-Allow-Headers": (
-                    "Content-Type,Authorization,Access_token,access_token"
-                ),
-                "Access-Control-Allow-Methods": ("OPTIONS,GET,POST,PUT,DELETE,PATCH"),
-            },
-        )
 
-    return None
+def load_validator(schema: dict, module: str = "compiled_validator"):
+    """
+    Return the validator generated by build_validators.py at bundling time,
+    falling back to compiling the schema when running from source.
+    """
+
+    try:
+        return importlib.import_module(module).validate
+    except ImportError:
+        return fastjsonschema.compile(schema)
 
 
 def get_user_id(headers):